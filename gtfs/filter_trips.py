@@ -1,99 +1,246 @@
+import argparse
+import os
+from typing import List, NamedTuple, Sequence
+
 import psycopg2
-import pandas as pd
+from psycopg2 import sql
 from tqdm import tqdm
-import os
 
-# Ensure 'filtered' directory exists
-output_dir = "filtered"
-os.makedirs(output_dir, exist_ok=True)
-
-# Define connection details
-conn = psycopg2.connect(
-    host="",
-    database="",
-    user="",
-    password=""
-)
-
-# Define the desired time range for filtering
-start_time = '08:00:00'
-end_time = '11:00:00'
-
-# Query to filter stop_times based on the specified time range
-stop_times_query = f"""
-SELECT *
-FROM stop_times
-WHERE arrival_time BETWEEN '{start_time}' AND '{end_time}'
-   OR departure_time BETWEEN '{start_time}' AND '{end_time}'
-"""
-
-# Execute the query and load the results into a DataFrame
-print("Querying filtered stop times from PostgreSQL...")
-filtered_stop_times_df = pd.read_sql_query(stop_times_query, conn)
-
-# Display progress while loading
-for _ in tqdm(range(len(filtered_stop_times_df)), desc="Loading data"):
-    pass  # Simulate a progress bar as the data is already loaded
-
-# Extract unique trip_ids
-filtered_trip_ids = filtered_stop_times_df['trip_id'].unique()
-print(f"Found {len(filtered_trip_ids)} unique trip_ids within the specified time range.")
-
-# Save the filtered stop_times DataFrame to stop_times.txt in the filtered directory
-filtered_stop_times_df.to_csv(os.path.join(output_dir, "stop_times.txt"), index=False)
-print("stop_times.txt file created successfully!")
-
-# Define and save trips.txt
-trips_query = "SELECT * FROM trips WHERE trip_id IN %s"
-filtered_trips_df = pd.read_sql_query(trips_query, conn, params=(tuple(filtered_trip_ids),))
-filtered_trips_df.to_csv(os.path.join(output_dir, "trips.txt"), index=False)
-print("trips.txt file created successfully!")
-
-# Get unique route_ids and service_ids for filtering routes and calendars
-filtered_route_ids = filtered_trips_df['route_id'].unique()
-filtered_service_ids = filtered_trips_df['service_id'].unique()
-
-# Define and save routes.txt
-routes_query = "SELECT * FROM routes WHERE route_id IN %s"
-filtered_routes_df = pd.read_sql_query(routes_query, conn, params=(tuple(filtered_route_ids),))
-filtered_routes_df.to_csv(os.path.join(output_dir, "routes.txt"), index=False)
-print("routes.txt file created successfully!")
-
-# Define and save stops.txt
-# we shouldnt edit this
-# stop_ids = filtered_stop_times_df['stop_id'].unique()
-# stops_query = "SELECT * FROM stops WHERE stop_id IN %s"
-# filtered_stops_df = pd.read_sql_query(stops_query, conn, params=(tuple(stop_ids),))
-# filtered_stops_df.to_csv(os.path.join(output_dir, "stops.txt"), index=False)
-# print("stops.txt file created successfully!")
-
-# Define and save calendar.txt with correct date format
-calendar_query = "SELECT * FROM calendar WHERE service_id IN %s"
-filtered_calendar_df = pd.read_sql_query(calendar_query, conn, params=(tuple(filtered_service_ids),))
-
-# Format start_date and end_date to YYYYMMDD
-filtered_calendar_df['start_date'] = pd.to_datetime(filtered_calendar_df['start_date']).dt.strftime('%Y%m%d')
-filtered_calendar_df['end_date'] = pd.to_datetime(filtered_calendar_df['end_date']).dt.strftime('%Y%m%d')
-
-filtered_calendar_df.to_csv(os.path.join(output_dir, "calendar.txt"), index=False)
-print("calendar.txt file created successfully!")
-
-# Define and save calendar_dates.txt with correct date format
-calendar_dates_query = "SELECT * FROM calendar_dates WHERE service_id IN %s"
-filtered_calendar_dates_df = pd.read_sql_query(calendar_dates_query, conn, params=(tuple(filtered_service_ids),))
-
-# Format date to YYYYMMDD
-filtered_calendar_dates_df['date'] = pd.to_datetime(filtered_calendar_dates_df['date']).dt.strftime('%Y%m%d')
-
-filtered_calendar_dates_df.to_csv(os.path.join(output_dir, "calendar_dates.txt"), index=False)
-print("calendar_dates.txt file created successfully!")
-
-# Define and save shapes.txt (if applicable)
-shape_ids = filtered_trips_df['shape_id'].dropna().unique()
-if len(shape_ids) > 0:
-    shapes_query = "SELECT * FROM shapes WHERE shape_id IN %s"
-    filtered_shapes_df = pd.read_sql_query(shapes_query, conn, params=(tuple(shape_ids),))
-    filtered_shapes_df.to_csv(os.path.join(output_dir, "shapes.txt"), index=False)
-    print("shapes.txt file created successfully!")
-# Close the database connection
-conn.close()
\ No newline at end of file
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+class TimeWindow(NamedTuple):
+    """A filtered feed: trips touching [start_time, end_time] on the given service days"""
+    name: str
+    start_time: str
+    end_time: str
+    days: Sequence[str] = ()  # empty means every service day
+
+
+# The feeds we usually need: weekday morning, Sunday morning, afternoon return trips
+DEFAULT_WINDOWS = [
+    TimeWindow('weekday_morning', '08:00:00', '11:00:00', WEEKDAYS[:5]),
+    TimeWindow('sunday_morning', '08:00:00', '11:00:00', ['sunday']),
+    TimeWindow('afternoon_return', '15:00:00', '19:00:00'),
+]
+
+
+class ProgressWriter:
+    """File wrapper that advances a tqdm bar by the number of bytes written"""
+
+    def __init__(self, f, progress):
+        self.f = f
+        self.progress = progress
+
+    def write(self, data):
+        self.progress.update(len(data))
+        return self.f.write(data)
+
+
+def copy_to_file(cur, query, path):
+    """Stream the result of a query straight into a GTFS .txt file using COPY"""
+    if isinstance(query, sql.Composable):
+        query = query.as_string(cur)
+    with open(path, 'wb') as f, tqdm(unit='B', unit_scale=True, desc=path) as progress:
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", ProgressWriter(f, progress))
+    print(f"{path} file created successfully!")
+
+
+def table_columns(cur, table):
+    """Return the column names of a table in their original order"""
+    cur.execute(sql.SQL("SELECT * FROM {} LIMIT 0").format(sql.Identifier(table)))
+    return [column.name for column in cur.description]
+
+
+def column_type(cur, table, column):
+    """Return the SQL type of a column, e.g. 'text' or 'interval'"""
+    cur.execute("""
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attname = %s
+    """, (table, column))
+    return cur.fetchone()[0]
+
+
+def parse_window(value):
+    """Parse 'name,HH:MM:SS,HH:MM:SS[,day+day...]' into a TimeWindow"""
+    parts = value.split(',')
+    if len(parts) not in (3, 4):
+        raise argparse.ArgumentTypeError(f"Invalid window '{value}', expected name,start,end[,day+day]")
+    days = parts[3].lower().split('+') if len(parts) == 4 and parts[3] else []
+    unknown = [day for day in days if day not in WEEKDAYS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown service day(s) {unknown} in window '{value}'")
+    return TimeWindow(parts[0], parts[1], parts[2], days)
+
+
+def _service_day_condition(day):
+    # A service runs on a weekday if calendar says so or calendar_dates adds a date on that weekday
+    return sql.SQL("""(
+        {day_name} = ANY(w.days) AND (
+            EXISTS (SELECT 1 FROM calendar c WHERE c.service_id = t.service_id AND c.{day} = 1)
+            OR EXISTS (
+                SELECT 1 FROM calendar_dates cd
+                WHERE cd.service_id = t.service_id
+                AND cd.exception_type = 1
+                AND EXTRACT(ISODOW FROM cd.date) = {isodow}
+            )
+        )
+    )""").format(
+        day_name=sql.Literal(day),
+        day=sql.Identifier(day),
+        isodow=sql.Literal(WEEKDAYS.index(day) + 1)
+    )
+
+
+def filter_feeds(conn, windows: List[TimeWindow], output_dir: str = "filtered") -> None:
+    """
+    Write one filtered GTFS feed per time window into output_dir/<window name>.
+
+    stop_times is scanned once: every row is tagged with all windows it falls into,
+    and the per-window feeds are then exported from that bucketed temp table.
+    Each feed only contains trips, routes, services and shapes that are referenced
+    by its own stop_times, so the feeds keep referential integrity.
+    """
+    if not windows:
+        raise ValueError("At least one time window is required")
+
+    cur = conn.cursor()
+    try:
+        # Window bounds get the type of stop_times.arrival_time (text, time or interval depending
+        # on the import), so the BETWEEN below compares like the untyped literals it replaces
+        time_type = sql.SQL(column_type(cur, 'stop_times', 'arrival_time'))
+        cur.execute(sql.SQL("""
+            CREATE TEMP TABLE time_windows (
+                window_name TEXT PRIMARY KEY,
+                start_time {time_type},
+                end_time {time_type},
+                days TEXT[]
+            ) ON COMMIT DROP
+        """).format(time_type=time_type))
+        for window in windows:
+            cur.execute(
+                "INSERT INTO time_windows VALUES (%s, %s, %s, %s)",
+                (window.name, window.start_time, window.end_time, list(window.days))
+            )
+
+        stop_times_columns = table_columns(cur, 'stop_times')
+        trips_columns = table_columns(cur, 'trips')
+
+        # Single pass over stop_times, bucketed by window
+        print(f"Bucketing stop_times into {len(windows)} time windows...")
+        cur.execute("""
+            CREATE TEMP TABLE windowed_stop_times ON COMMIT DROP AS
+            SELECT w.window_name, st.*
+            FROM stop_times st
+            JOIN time_windows w
+              ON st.arrival_time BETWEEN w.start_time AND w.end_time
+              OR st.departure_time BETWEEN w.start_time AND w.end_time
+        """)
+        cur.execute("CREATE INDEX ON windowed_stop_times (window_name, trip_id)")
+
+        # Keep only trips whose service runs on one of the window's days
+        day_conditions = sql.SQL(" OR ").join(_service_day_condition(day) for day in WEEKDAYS)
+        cur.execute(sql.SQL("""
+            CREATE TEMP TABLE windowed_trips ON COMMIT DROP AS
+            SELECT w.window_name, t.*
+            FROM (SELECT DISTINCT window_name, trip_id FROM windowed_stop_times) ws
+            JOIN time_windows w USING (window_name)
+            JOIN trips t USING (trip_id)
+            WHERE cardinality(w.days) = 0 OR {day_conditions}
+        """).format(day_conditions=day_conditions))
+        cur.execute("CREATE INDEX ON windowed_trips (window_name, trip_id)")
+        cur.execute("ANALYZE windowed_stop_times, windowed_trips")
+
+        for window in windows:
+            feed_dir = os.path.join(output_dir, window.name)
+            os.makedirs(feed_dir, exist_ok=True)
+            print(f"Exporting feed '{window.name}' ({window.start_time}-{window.end_time}, "
+                  f"{'+'.join(window.days) or 'all days'})...")
+            _export_feed(cur, window.name, feed_dir, stop_times_columns, trips_columns)
+    finally:
+        cur.close()
+        conn.rollback()  # drops the ON COMMIT DROP temp tables
+
+
+def _export_feed(cur, window_name, feed_dir, stop_times_columns, trips_columns):
+    window = sql.Literal(window_name)
+
+    copy_to_file(cur, sql.SQL("""
+        SELECT {columns}
+        FROM windowed_stop_times st
+        WHERE st.window_name = {window}
+        AND EXISTS (
+            SELECT 1 FROM windowed_trips t
+            WHERE t.window_name = st.window_name AND t.trip_id = st.trip_id
+        )
+    """).format(
+        columns=sql.SQL(', ').join(sql.Identifier('st', c) for c in stop_times_columns if c != 'window_name'),
+        window=window
+    ), os.path.join(feed_dir, "stop_times.txt"))
+
+    copy_to_file(cur, sql.SQL("""
+        SELECT {columns}
+        FROM windowed_trips t
+        WHERE t.window_name = {window}
+    """).format(
+        columns=sql.SQL(', ').join(sql.Identifier('t', c) for c in trips_columns if c != 'window_name'),
+        window=window
+    ), os.path.join(feed_dir, "trips.txt"))
+
+    copy_to_file(cur, sql.SQL("""
+        SELECT r.*
+        FROM routes r
+        WHERE r.route_id IN (SELECT route_id FROM windowed_trips WHERE window_name = {window})
+    """).format(window=window), os.path.join(feed_dir, "routes.txt"))
+
+    # stops.txt is not filtered, we shouldnt edit this
+
+    # Format dates to YYYYMMDD directly in the export
+    copy_to_file(cur, sql.SQL("""
+        SELECT c.service_id, c.monday, c.tuesday, c.wednesday, c.thursday, c.friday, c.saturday, c.sunday,
+               to_char(c.start_date, 'YYYYMMDD') AS start_date,
+               to_char(c.end_date, 'YYYYMMDD') AS end_date
+        FROM calendar c
+        WHERE c.service_id IN (SELECT service_id FROM windowed_trips WHERE window_name = {window})
+    """).format(window=window), os.path.join(feed_dir, "calendar.txt"))
+
+    copy_to_file(cur, sql.SQL("""
+        SELECT cd.service_id, to_char(cd.date, 'YYYYMMDD') AS date, cd.exception_type
+        FROM calendar_dates cd
+        WHERE cd.service_id IN (SELECT service_id FROM windowed_trips WHERE window_name = {window})
+    """).format(window=window), os.path.join(feed_dir, "calendar_dates.txt"))
+
+    # Define and save shapes.txt (if applicable)
+    cur.execute(sql.SQL("""
+        SELECT EXISTS (SELECT 1 FROM windowed_trips WHERE window_name = {window} AND shape_id IS NOT NULL)
+    """).format(window=window))
+    if cur.fetchone()[0]:
+        copy_to_file(cur, sql.SQL("""
+            SELECT s.*
+            FROM shapes s
+            WHERE s.shape_id IN (
+                SELECT shape_id FROM windowed_trips WHERE window_name = {window} AND shape_id IS NOT NULL
+            )
+        """).format(window=window), os.path.join(feed_dir, "shapes.txt"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export time-window filtered GTFS feeds from PostgreSQL")
+    parser.add_argument("--dsn", default=os.environ.get("GTFS_DSN", ""),
+                        help="libpq connection string (defaults to $GTFS_DSN / PG* environment variables)")
+    parser.add_argument("--output-dir", default="filtered", help="Directory to write one feed per window into")
+    parser.add_argument("--window", dest="windows", action="append", type=parse_window,
+                        help="name,start,end[,day+day], e.g. weekday_morning,08:00:00,11:00:00,monday+friday. "
+                             "Can be repeated; defaults to weekday morning, Sunday morning and afternoon return")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        filter_feeds(conn, args.windows or DEFAULT_WINDOWS, args.output_dir)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+from db_pool import execute_prepared
+from vertex_poi_index import vertex_poi_index
+from metrics import span
+
 def find_bounce_path(cur, start_vertex_id, desired_length, elevation_type, 
                     surface_weight, elevation_weight, trail_weight,
                     prefer_hard_surface, preferred_trail_type,
-                    bounce_factor=0.4, poi_preferences=None):
+                    bounce_factor=0.4, poi_preferences=None, graph_manager=None):
     max_attempts = 10
     attempts = 0
     last_error = None
@@ -27,7 +31,8 @@ def find_bounce_path(cur, start_vertex_id, desired_length, elevation_type,
         cur, 
         start_vertex_id, 
         desired_length * bounce_factor,
-        poi_preferences
+        poi_preferences,
+        graph_manager
     )
     
     while attempts < max_attempts:
@@ -38,13 +43,7 @@ def find_bounce_path(cur, start_vertex_id, desired_length, elevation_type,
             target_vertex, lake_distance = next(bounce_vertices)
             
             # Get bounce vertex coordinates
-            cur.execute(f"""
-                SELECT 
-                    ST_X(ST_Transform(vertex, 4326)) as lon,
-                    ST_Y(ST_Transform(vertex, 4326)) as lat
-                FROM {VERTICES_TABLE}
-                WHERE vertex_id = %s
-            """, (target_vertex,))
+            execute_prepared(cur, 'vertex_coordinates', (target_vertex,))
             
             bounce_coords = cur.fetchone()
             if bounce_coords:
@@ -113,45 +112,40 @@ def find_bounce_path(cur, start_vertex_id, desired_length, elevation_type,
     
     raise ValueError(f"Could not find any valid bounce path after {max_attempts} attempts. Last error: {last_error}")
 
-def choose_bounce_vertices_generator(cur, start_vertex_id, target_distance, poi_preferences):
+def choose_bounce_vertices_generator(cur, start_vertex_id, target_distance, poi_preferences,
+                                     graph_manager=None, flexibility=0.2):
     """
     Generator that yields suitable bounce points (vertex_id, poi_distance) based on:
     - Distance from start vertex (approximately target_distance)
     - Proximity to specified POI type (lake or restaurant)
+    Candidates are ranked in memory from the vertex POI index, best first.
+    With a graph_manager the distance is the trail distance from a single
+    one-to-many search, so unreachable or detour-heavy vertices are skipped.
     """
     # Determine POI type based on preferences
-    poi_type = 'restaurant_guesthouse' if poi_preferences.restaurant else 'lake'
-    
-    # Query vertices that meet both distance and POI criteria
-    query = """
-    SELECT 
-        v.vertex_id,
-        p.poi_distance
-    FROM wanderwege_vertices_3 v
-    JOIN vertex_has_poi p ON v.vertex_id = p.vertex_id
-    WHERE 
-        p.poi_type = %s AND
-        p.poi_distance <= %s AND
-        ST_DWithin(v.vertex, 
-            (SELECT vertex FROM wanderwege_vertices_3 WHERE vertex_id = %s),
-            %s)
-    ORDER BY 
-        (p.poi_distance / %s) +  -- Normalize POI distance
-        (ABS(ST_Distance(v.vertex, 
-            (SELECT vertex FROM wanderwege_vertices_3 WHERE vertex_id = %s)) 
-            - %s) / %s) ASC      -- Normalize target distance
-    """
-    
-    cur.execute(query, (
-        poi_type,
-        current_poi_distance,
-        start_vertex_id,
-        current_distance * 1.2,  # Allow 20% flexibility
-        current_poi_distance,
+    if poi_preferences.restaurant:
+        poi_type = 'restaurant_guesthouse'
+        max_poi_distance = poi_preferences.restaurant_distance
+    else:
+        poi_type = 'lake'
+        max_poi_distance = poi_preferences.lake_distance
+
+    with span('bounce_candidates'):
+        # No-op once the index was loaded at startup
+        vertex_poi_index.load(cur)
+
+        network_distances = None
+        if graph_manager is not None:
+            network_distances = graph_manager.network_distances(
+                start_vertex_id,
+                target_distance * (1 + flexibility)
+            )
+
+    yield from vertex_poi_index.ranked_bounce_candidates(
         start_vertex_id,
         target_distance,
-        target_distance
-    ))
-    
-    if row := cur.fetchone():
-        yield row[0], row[1]  # vertex_id, poi_distance
\ No newline at end of file
+        poi_type,
+        max_poi_distance,
+        flexibility=flexibility,
+        network_distances=network_distances
+    )
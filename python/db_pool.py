@@ -0,0 +1,194 @@
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Optional
+from psycopg2.extensions import connection, cursor
+from psycopg2.pool import ThreadedConnectionPool
+from metrics import count
+
+# Server-side prepared statements for the hot queries of the route pipeline.
+# They are prepared lazily, once per pooled connection, and called via execute_prepared.
+# Lookup points are transformed once in an InitPlan and nearest-neighbour ordering uses
+# the GiST-indexed <-> operator instead of sorting by ST_Distance.
+PREPARED_STATEMENTS: Dict[str, str] = {
+    'nearest_stations': """
+        WITH point AS (
+            SELECT ST_Transform(ST_SetSRID(ST_MakePoint($1, $2), 4326), 2056) AS geom
+        )
+        SELECT xtf_id, name
+        FROM stops
+        WHERE ST_DWithin(geom, (SELECT geom FROM point), $3)
+        ORDER BY geom <-> (SELECT geom FROM point)
+    """,
+    'nearest_end_stop': """
+        WITH point AS (
+            SELECT ST_Transform(ST_SetSRID(ST_MakePoint($1, $2), 4326), 2056) AS geom
+        )
+        SELECT
+            xtf_id,
+            name,
+            verkehrsmittel_bezeichnung,
+            ST_X(ST_Transform(geom, 4326)) as lon,
+            ST_Y(ST_Transform(geom, 4326)) as lat,
+            ST_Distance(geom, (SELECT geom FROM point)) as distance
+        FROM stops
+        ORDER BY geom <-> (SELECT geom FROM point)
+        LIMIT 1
+    """,
+    'isochrone_cache_lookup': """
+        SELECT multipolygon
+        FROM isochrone_cache
+        WHERE ST_DWithin(
+            ST_Transform(start_coordinates, 2056),
+            ST_Transform(ST_SetSRID(ST_MakePoint($1, $2), 4326), 2056),
+            200
+        )
+        AND cutoff = $3
+        AND is_sunday = $4
+        ORDER BY created_at DESC
+        LIMIT 1
+    """,
+    'isochrone_cache_geojson': """
+        SELECT ST_AsGeoJSON(multipolygon)
+        FROM isochrone_cache
+        WHERE ST_DWithin(
+            ST_Transform(start_coordinates, 2056),
+            ST_Transform(ST_SetSRID(ST_MakePoint($1, $2), 4326), 2056),
+            200
+        )
+        AND cutoff = $3
+        AND is_sunday = $4
+        ORDER BY created_at DESC
+        LIMIT 1
+    """,
+    'vertex_coordinates': """
+        SELECT
+            ST_X(ST_Transform(vertex, 4326)) as lon,
+            ST_Y(ST_Transform(vertex, 4326)) as lat
+        FROM wanderwege_vertices_3
+        WHERE vertex_id = $1
+    """,
+}
+
+class CountingCursor(cursor):
+    """Cursor of pooled connections, reports every statement as an SQL round trip to the request metrics"""
+
+    def execute(self, query, vars=None):
+        count('sql_round_trips')
+        return super().execute(query, vars)
+
+class PreparingConnection(connection):
+    """Connection that remembers which statements were already prepared on its session"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.cursor_factory = CountingCursor
+
+_pool: Optional[ThreadedConnectionPool] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+
+def init_pool(minconn: int = 2, maxconn: int = 10, **connect_kwargs) -> None:
+    """Create the shared connection pool (call once at startup)"""
+    global _pool, _slots
+    if _pool is not None:
+        return
+    _pool = ThreadedConnectionPool(minconn, maxconn, connection_factory=PreparingConnection, **connect_kwargs)
+    # ThreadedConnectionPool raises when exhausted, the semaphore makes callers wait instead
+    _slots = threading.BoundedSemaphore(maxconn)
+    print(f"Initialized database pool with {minconn}-{maxconn} connections")
+
+def close_pool() -> None:
+    """Close all pooled connections (call on shutdown)"""
+    global _pool, _slots
+    if _pool is not None:
+        _pool.closeall()
+    _pool = None
+    _slots = None
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the pool, commit on success, roll back on error.
+    The route modules run on the cursor their caller passes in, so the pool's
+    wait-when-exhausted limit and the SQL round-trip counting only cover requests
+    whose handler opens its cursor here, plus the modules' own fallbacks when no
+    cursor is passed.
+    """
+    if _pool is None:
+        raise RuntimeError("Database pool not initialized, call init_pool() first")
+
+    _slots.acquire()
+    try:
+        conn = _pool.getconn()
+    except Exception:
+        _slots.release()
+        raise
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _pool.putconn(conn)
+        _slots.release()
+
+@contextmanager
+def pooled_cursor():
+    """Borrow a connection from the pool and yield a cursor on it"""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+def closest_vertices_statement(vertices_table: str) -> str:
+    """Register (once) and return the name of the closest start/end vertex lookup for a vertices table"""
+    # Statement names are plain identifiers, a schema-qualified or quoted table name is not one;
+    # the crc keeps e.g. "a.b" and "a_b" apart
+    name = f"closest_vertices_{re.sub(r'[^0-9A-Za-z_]', '_', vertices_table)}"
+    if not re.fullmatch(r'[0-9A-Za-z_]+', vertices_table):
+        name = f"{name}_{zlib.crc32(vertices_table.encode()):08x}"
+    PREPARED_STATEMENTS.setdefault(name, f"""
+        SELECT v.vertex_id, ST_AsText(v.vertex), ST_Distance(v.vertex, pt.geom) AS dist
+        FROM (VALUES
+            (1, ST_GeomFromText($1, 2056)),
+            (2, ST_GeomFromText($2, 2056))
+        ) AS pt(idx, geom)
+        CROSS JOIN LATERAL (
+            SELECT vertex_id, vertex
+            FROM {vertices_table}
+            ORDER BY vertex <-> pt.geom
+            LIMIT 1
+        ) v
+        ORDER BY pt.idx
+    """)
+    return name
+
+def _as_pyformat(statement: str, params: tuple):
+    """Turn $1, $2, ... placeholders into psycopg2 %s placeholders with matching params"""
+    positions = [int(n) - 1 for n in re.findall(r'\$(\d+)', statement)]
+    query = re.sub(r'\$\d+', '%s', statement.replace('%', '%%'))
+    return query, tuple(params[i] for i in positions)
+
+def execute_prepared(cur, name: str, params: tuple = ()) -> None:
+    """Execute a registered prepared statement, preparing it on this connection first if needed"""
+    # Connections outside the pool don't track prepared statements, so use a plain query there
+    prepared = getattr(cur.connection, 'prepared', None)
+    if prepared is None:
+        cur.execute(*_as_pyformat(PREPARED_STATEMENTS[name], params))
+        return
+
+    # A pooled connection is only used by one request at a time, no locking needed
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} AS {PREPARED_STATEMENTS[name]}")
+        prepared.add(name)
+
+    if params:
+        placeholders = ', '.join(['%s'] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
@@ -0,0 +1,217 @@
+"""
+Precomputed explore routes per public transport stop.
+
+For every stop's start vertex, each of the 18 preference combinations
+(elevation type x surface preference x trail type) and each desired length in
+LENGTHS, the offline job runs the exact search find_exploration_path runs live
+(equal weights, the given tolerance, no avoidance) and stores the path it
+picks from that explore tree. A request with equal weights and no avoidance is
+then a lookup instead of a Dijkstra search: it gets the route stored for the
+nearest length if that route's length lies within the request's own tolerance
+band, otherwise it is searched live. Only for a stored length at the stored
+tolerance is the route exactly the one the live search would pick. The paths
+are raw binary files opened with np.memmap, so all workers share one copy in
+the page cache.
+
+Only the winning path of each tree is kept, not the tree, so the store grows
+with stops x 18 x len(LENGTHS) x path vertices. precompute estimates that size
+from the mean edge length before it starts and refuses to run past max_bytes.
+The store is stamped with the snapshot's data version and only serves a graph
+loaded from that same snapshot.
+
+    python explore_trees.py --snapshot routing_snapshot.npz --output explore_trees --workers 8
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models import ElevationType, TrailType
+from routing_snapshot import load_snapshot
+
+# Fixed order, the combination index is part of the file layout
+PREFERENCE_COMBINATIONS = [
+    (elevation_type, prefer_hard_surface, trail_type)
+    for elevation_type in ElevationType
+    for prefer_hard_surface in (True, False)
+    for trail_type in TrailType
+]
+EQUAL_WEIGHTS = {'elevation': 1.0, 'surface': 1.0, 'trail': 1.0}
+LENGTHS = tuple(range(1000, 20001, 1000))  # Desired lengths (meters) with a stored route
+DEFAULT_TOLERANCE = 0.1
+MAX_BYTES = 20 * 1024 ** 3  # Refuse to write a store estimated larger than this
+
+def build_routes(manager, start_vertex: int, combination: Tuple, lengths: Sequence[int],
+                 tolerance: float) -> List[Tuple[np.ndarray, float]]:
+    """(path, total length) find_exploration_path returns for every length, an empty path where it finds none"""
+    elevation_type, prefer_hard_surface, trail_type = combination
+    routes = []
+    for desired_length in lengths:
+        try:
+            candidates = manager._exploration_candidates(start_vertex, desired_length, EQUAL_WEIGHTS, tolerance, [],
+                                                         elevation_type, prefer_hard_surface, trail_type)
+        except ValueError:
+            routes.append((np.empty(0, dtype=np.int32), np.nan))
+            continue
+        # Same choice as find_exploration_path
+        best_target = min(candidates, key=lambda k: candidates[k][0])
+        _, best_length, best_path = candidates[best_target]
+        routes.append((np.array(best_path, dtype=np.int32), best_length))
+    return routes
+
+def estimate_bytes(num_starts: int, mean_edge_length: float, lengths: Sequence[int]) -> int:
+    """Rough store size: a route to length L has about L / mean_edge_length vertices of 4 bytes, plus 16 bytes index"""
+    per_start = sum(length / mean_edge_length * 4 + 16 for length in lengths) * len(PREFERENCE_COMBINATIONS)
+    return int(num_starts * per_start)
+
+_worker_manager = None
+
+def _init_worker(snapshot_file: str) -> None:
+    global _worker_manager
+    # Imported here, graph_manager itself imports this module for the lookup
+    from graph_manager import GraphManager
+    _worker_manager = GraphManager(cache_file='', snapshot_file=snapshot_file)
+    _worker_manager.build_graph()
+
+def _build_start_routes(args: Tuple[int, Tuple[int, ...], float]) -> List[Tuple[np.ndarray, float]]:
+    start_vertex, lengths, tolerance = args
+    return [route
+            for combination in PREFERENCE_COMBINATIONS
+            for route in build_routes(_worker_manager, start_vertex, combination, lengths, tolerance)]
+
+def precompute(snapshot_file: str, output_dir: str, workers: int = 4, lengths: Sequence[int] = LENGTHS,
+               tolerance: float = DEFAULT_TOLERANCE, max_bytes: int = MAX_BYTES) -> None:
+    """Compute the routes of every stop's start vertex and write them to output_dir"""
+    snapshot = load_snapshot(snapshot_file)
+    starts = np.unique(np.fromiter(snapshot.stop_vertices().values(), dtype=np.int64))
+    lengths = tuple(sorted(lengths))
+
+    estimate = estimate_bytes(len(starts), float(np.nanmean(snapshot.arrays['edge_length'])), lengths)
+    print(f"Estimated explore route store size: {estimate / 1024 ** 3:.1f} GB")
+    if estimate > max_bytes:
+        raise ValueError(f"Estimated store size {estimate / 1024 ** 3:.1f} GB exceeds the limit of "
+                         f"{max_bytes / 1024 ** 3:.1f} GB, precompute fewer lengths or raise the limit")
+
+    print(f"Precomputing {len(starts) * len(PREFERENCE_COMBINATIONS) * len(lengths)} explore routes "
+          f"for {len(starts)} start vertices on {workers} processes...")
+    os.makedirs(output_dir, exist_ok=True)
+    offsets = [0]
+    route_lengths = []
+    start_time = time.perf_counter()
+    with open(os.path.join(output_dir, 'path.bin'), 'wb') as f:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(snapshot_file,)) as executor:
+            # Routes are streamed to disk in start order, only one chunk is held in memory
+            jobs = ((int(start), lengths, tolerance) for start in starts)
+            for done, routes in enumerate(executor.map(_build_start_routes, jobs, chunksize=16), 1):
+                for path, length in routes:
+                    path.tofile(f)
+                    offsets.append(offsets[-1] + len(path))
+                    route_lengths.append(length)
+                if done % 1000 == 0:
+                    print(f"{done}/{len(starts)} start vertices ({time.perf_counter() - start_time:.0f}s)")
+
+    np.savez(
+        os.path.join(output_dir, 'index.npz'),
+        starts=starts,
+        lengths=np.array(lengths, dtype=np.int64),
+        tolerance=np.array(tolerance),
+        offsets=np.array(offsets, dtype=np.int64),
+        route_length=np.array(route_lengths, dtype=float),
+        data_version=np.array(snapshot.data_version)
+    )
+    print(f"Saved {len(route_lengths)} routes ({offsets[-1]} path vertices) to {output_dir} "
+          f"in {time.perf_counter() - start_time:.0f}s")
+
+class ExploreTreeStore:
+    """Memory-mapped access to the precomputed explore routes"""
+
+    def __init__(self):
+        self.loaded = False
+        self.starts = np.empty(0, dtype=np.int64)
+        self.lengths = np.empty(0, dtype=np.int64)
+        self.tolerance: Optional[float] = None
+        self.offsets = np.empty(0, dtype=np.int64)
+        self.route_length = np.empty(0)
+        self.data_version: Optional[str] = None
+        self.path = np.empty(0, dtype=np.int32)
+
+    def load(self, directory: str, data_version: Optional[str]) -> None:
+        """
+        Open the files written by precompute (call once at startup) for the graph of the
+        given data version, i.e. the GraphManager's data_version after build_graph.
+        """
+        with np.load(os.path.join(directory, 'index.npz'), allow_pickle=False) as index:
+            stored_version = str(index['data_version'])
+            if stored_version != data_version:
+                raise ValueError(f"Explore routes in {directory} were built for data version {stored_version}, "
+                                 f"the graph has {data_version}")
+            self.starts = index['starts']
+            self.lengths = index['lengths']
+            self.tolerance = float(index['tolerance'])
+            self.offsets = index['offsets']
+            self.route_length = index['route_length']
+        self.data_version = stored_version
+        if self.offsets[-1] > 0:
+            self.path = np.memmap(os.path.join(directory, 'path.bin'), dtype=np.int32, mode='r')
+        else:
+            # No route was found at all, np.memmap refuses an empty file
+            self.path = np.empty(0, dtype=np.int32)
+        self.loaded = True
+        print(f"Opened explore routes for {len(self.starts)} start vertices")
+
+    def serves(self, data_version: Optional[str]) -> bool:
+        """Whether the store is loaded and was built from the graph of this data version"""
+        return self.loaded and data_version is not None and data_version == self.data_version
+
+    def lookup(self,
+               start_vertex: int,
+               desired_length: float,
+               tolerance: float,
+               elevation_type: ElevationType,
+               prefer_hard_surface: bool,
+               preferred_trail_type: TrailType) -> Optional[Dict]:
+        """
+        The route stored for the length nearest to desired_length, in the shape of
+        find_exploration_path's result. None if the start was not precomputed, no route
+        was found or the stored route's length is outside desired_length +- tolerance.
+        """
+        row = np.searchsorted(self.starts, start_vertex)
+        if not self.loaded or not len(self.lengths) or row >= len(self.starts) or self.starts[row] != start_vertex:
+            return None
+        band = int(np.argmin(np.abs(self.lengths - desired_length)))
+
+        combination = PREFERENCE_COMBINATIONS.index((elevation_type, prefer_hard_surface, preferred_trail_type))
+        route = (row * len(PREFERENCE_COMBINATIONS) + combination) * len(self.lengths) + band
+        begin, end = self.offsets[route], self.offsets[route + 1]
+        route_length = float(self.route_length[route])
+        if begin == end or not desired_length * (1 - tolerance) <= route_length <= desired_length * (1 + tolerance):
+            return None
+        path = self.path[begin:end].tolist()
+        return {
+            'end_vertex': path[-1],
+            'total_length': route_length,
+            'path': path
+        }
+
+# Shared store, opened once at startup if routes were precomputed
+explore_tree_store = ExploreTreeStore()
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute explore routes per public transport stop")
+    parser.add_argument("--snapshot", default="routing_snapshot.npz", help="Routing snapshot to build the graph from")
+    parser.add_argument("--output", default="explore_trees")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--lengths", type=int, nargs='+', default=list(LENGTHS), help="Desired lengths in meters")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--max-gb", type=float, default=MAX_BYTES / 1024 ** 3, help="Size limit of the store")
+    args = parser.parse_args()
+
+    precompute(args.snapshot, args.output, args.workers, args.lengths, args.tolerance,
+               int(args.max_gb * 1024 ** 3))
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,31 @@
+import warnings
+from db_pool import execute_prepared
+from metrics import timed
+
+@timed('end_stop')
 def find_end_stop(
     cur,
     end_coords: List[float],  # [lon, lat]
     is_sunday: bool = False,
-    initial_radius: int = 1000,
+    initial_radius: Optional[int] = None,
     max_radius: int = 5000,
-    radius_increment: int = 500
+    radius_increment: Optional[int] = None
 ) -> Tuple[str, str, float, float, float]:  # Returns (fid, name, type, lon, lat)
     """
-    Find the nearest public transport stop to the end point.
-    Gradually increases search radius until a stop is found.
+    Find the nearest public transport stop within max_radius of the end point
+    with a single index-assisted nearest-neighbour lookup.
+    initial_radius and radius_increment are deprecated and have no effect.
     """
-    current_radius = initial_radius
-    
-    while current_radius <= max_radius:
-        print(f"Searching for end station within {current_radius}m...")
-        
-        # Query for stations within current radius
-        cur.execute("""
-            SELECT 
-                xtf_id, 
-                name, 
-                verkehrsmittel_bezeichnung,
-                ST_X(ST_Transform(geom, 4326)) as lon,
-                ST_Y(ST_Transform(geom, 4326)) as lat,
-                ST_Distance(
-                    geom,
-                    ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), 4326), 2056)
-                ) as distance
-            FROM stops 
-            WHERE ST_DWithin(
-                geom,
-                ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), 4326), 2056),
-                %s
-            )
-            ORDER BY distance ASC
-            LIMIT 1;
-        """, (end_coords[0], end_coords[1], end_coords[0], end_coords[1], current_radius))
-        
-        result = cur.fetchone()
-        
-        if result:
-            print(f"Found end station: {result[1]} at distance {result[5]:.2f}m")
-            return result
-            
-        print(f"No stations found within {current_radius}m, increasing radius...")
-        current_radius += radius_increment
-    
+    if initial_radius is not None or radius_increment is not None:
+        warnings.warn("find_end_stop: initial_radius and radius_increment are deprecated and ignored",
+                      DeprecationWarning, stacklevel=2)
+    print(f"Searching for end station within {max_radius}m...")
+    execute_prepared(cur, 'nearest_end_stop', (end_coords[0], end_coords[1]))
+
+    result = cur.fetchone()
+
+    if result and result[5] <= max_radius:
+        print(f"Found end station: {result[1]} at distance {result[5]:.2f}m")
+        return result
+
     raise ValueError(f"No public transport stops found within {max_radius}m of end point")
\ No newline at end of file
@@ -1,16 +1,14 @@
-def get_closest_vertices(cur, start_point_wkt, end_point_wkt, vertices_table=VERTICES_TABLE):
-    cur.execute(f"""
-        SELECT vertex_id, ST_AsText(vertex), ST_Distance(vertex, ST_GeomFromText(%s, 2056)) AS dist
-        FROM {vertices_table}
-        ORDER BY dist ASC LIMIT 1;
-    """, (start_point_wkt,))
-    closest_start_vertex = cur.fetchone()
+from db_pool import closest_vertices_statement, execute_prepared
+from metrics import timed
 
-    cur.execute(f"""
-        SELECT vertex_id, ST_AsText(vertex), ST_Distance(vertex, ST_GeomFromText(%s, 2056)) AS dist
-        FROM {vertices_table}
-        ORDER BY dist ASC LIMIT 1;
-    """, (end_point_wkt,))
-    closest_end_vertex = cur.fetchone()
+@timed('vertex_snapping')
+def get_closest_vertices(cur, start_point_wkt, end_point_wkt, vertices_table=VERTICES_TABLE):
+    # Both lookups in one round trip, each a KNN index scan on the vertices table
+    execute_prepared(cur, closest_vertices_statement(vertices_table), (start_point_wkt, end_point_wkt))
+    rows = cur.fetchall()
+    if len(rows) < 2:
+        # Empty vertices table, no row per point
+        return None, None
+    closest_start_vertex, closest_end_vertex = rows
 
     return closest_start_vertex, closest_end_vertex
\ No newline at end of file
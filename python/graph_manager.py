@@ -3,29 +3,87 @@ import pickle
 import os
 import numpy as np
 from typing import Dict, List, Tuple, Optional
+from route_trace import RouteTrace, edge_breakdown
+from metrics import count, timed
+from route_stats import EdgeArrays, route_statistics
 from models import ElevationType, TrailType
 from cost_utils import calculate_cost
+from db_pool import pooled_cursor
+from routing_snapshot import load_snapshot
+from explore_trees import explore_tree_store
 from datetime import datetime, timedelta
 import math
+import heapq
+import struct
+
+# (elevation, surface, trail) weightings a Pareto set always keeps a route for
+PARETO_WEIGHT_GRID = [
+    (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0),
+    (1.0, 1.0, 0.0), (1.0, 0.0, 1.0), (0.0, 1.0, 1.0), (1.0, 1.0, 1.0)
+]
+
+def select_pareto_route(routes: List[Dict], cost_weights: Dict[str, float]) -> Dict:
+    """Route of a find_pareto_paths result with the lowest weighted cost for the given weights"""
+    return min(routes, key=lambda route: sum(
+        cost_weights.get(criterion, 0.0) * cost for criterion, cost in route['costs'].items()
+    ))
+
+def _ewkb_end_point(geom: str) -> Tuple[float, float]:
+    """x, y of the last point of a hex EWKB LineString or MultiLineString as stored on the edges"""
+    data = bytes.fromhex(geom)
+    
+    def header(offset):
+        order = '<' if data[offset] == 1 else '>'
+        (geom_type,) = struct.unpack_from(order + 'I', data, offset + 1)
+        offset += 9 if geom_type & 0x20000000 else 5  # skip the SRID
+        dims = 2 + bool(geom_type & 0x80000000) + bool(geom_type & 0x40000000)
+        (size,) = struct.unpack_from(order + 'I', data, offset)
+        return order, geom_type & 0xFF, dims, size, offset + 4
+    
+    order, geom_type, dims, size, offset = header(0)
+    if geom_type == 5:
+        # MultiLineString, the end point is that of the last line
+        for i in range(size):
+            order, _, dims, points, offset = header(offset)
+            if i < size - 1:
+                offset += points * dims * 8
+        size = points
+    return struct.unpack_from(order + 'dd', data, offset + (size - 1) * dims * 8)
 
 class GraphManager:
     CACHE_DURATION = timedelta(hours=24)  # Cache valid for 24 hours
     ELEVATION_SENSITIVITY = 5.0  # Add this line back
+    AVOID_PENALTY = 10.0  # Cost multiplier for edges touching avoided vertices or edges
     
-    def __init__(self, cache_file='hiking_graph.pickle'):
+    def __init__(self, cache_file='hiking_graph.pickle', snapshot_file=None):
         self.G = nx.DiGraph()
         self.graph_built = False
         self.cache_file = cache_file
+        self.snapshot_file = snapshot_file
+        self.data_version: Optional[str] = None  # Snapshot export the graph was loaded from
+        self._vertex_index = None
+        self._edge_arrays = None
+        self._edge_minutes_count = 0
         
     def _is_cache_valid(self):
         """Check if cache file exists"""
         return os.path.exists(self.cache_file)
         
-    def build_graph(self, cur) -> None:
-        """Build graph from database edges and cache it"""
+    def build_graph(self, cur=None) -> None:
+        """Build graph from database edges and cache it (uses a pooled cursor if none is given)"""
         if self.graph_built:
             return
             
+        # A routing snapshot from preprocessing replaces both the cache and the database scan
+        if self.snapshot_file and os.path.exists(self.snapshot_file):
+            snapshot = load_snapshot(self.snapshot_file)
+            self._add_edges(snapshot.edge_rows())
+            self._add_vertex_coordinates(*snapshot.vertex_arrays([])[:3])
+            self.data_version = snapshot.data_version
+            self.graph_built = True
+            print(f"Loaded graph from routing snapshot: {self.snapshot_file}")
+            return
+            
         # Try to load from cache first
         if self._is_cache_valid():
             try:
@@ -38,6 +96,10 @@ class GraphManager:
                 print(f"Error loading cache: {e}")
         
         # If cache invalid or loading failed, build from database
+        if cur is None:
+            with pooled_cursor() as cur:
+                return self.build_graph(cur)
+
         print("Building graph from database...")
         # Get all edges with their attributes
         cur.execute("""
@@ -46,8 +108,21 @@ class GraphManager:
             FROM wanderwege_edges_3
         """)
         
-        # Add edges with attributes
-        for edge in cur.fetchall():
+        self._add_edges(cur.fetchall())
+        
+        # Save to cache
+        try:
+            with open(self.cache_file, 'wb') as f:
+                pickle.dump(self.G, f)
+            print(f"Saved graph to cache: {self.cache_file}")
+        except Exception as e:
+            print(f"Error saving cache: {e}")
+            
+        self.graph_built = True
+    
+    def _add_edges(self, edges) -> None:
+        """Add edge rows (id, source, target, length, elevation_difference, belagsart, wanderwege, tobler_duration, geom)"""
+        for edge in edges:
             self.G.add_edge(
                 edge[1],  # source
                 edge[2],  # target
@@ -59,17 +134,33 @@ class GraphManager:
                 duration=edge[7],
                 geom=edge[8]
             )
-        
-        # Save to cache
-        try:
-            with open(self.cache_file, 'wb') as f:
-                pickle.dump(self.G, f)
-            print(f"Saved graph to cache: {self.cache_file}")
-        except Exception as e:
-            print(f"Error saving cache: {e}")
-            
-        self.graph_built = True
     
+    def _add_vertex_coordinates(self, vertex_ids: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        """Store LV95 coordinates as x/y node attributes of the vertices in the graph"""
+        for vertex, vx, vy in zip(vertex_ids.tolist(), x.tolist(), y.tolist()):
+            if vertex in self.G:
+                self.G.nodes[vertex]['x'] = vx
+                self.G.nodes[vertex]['y'] = vy
+    
+    def vertex_coordinates(self, vertex_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        LV95 coordinates of vertices from their x/y node attributes (set from a snapshot),
+        else from the end point of an incoming edge's geometry, remembered on the node.
+        """
+        x = np.empty(len(vertex_ids))
+        y = np.empty(len(vertex_ids))
+        for i, vertex in enumerate(vertex_ids):
+            node = self.G.nodes[vertex]
+            if 'x' not in node:
+                source = next(iter(self.G.pred[vertex]), None)
+                geom = self.G[source][vertex].get('geom') if source is not None else None
+                if not geom:
+                    raise ValueError(f"No coordinates for vertex {vertex} in the graph")
+                node['x'], node['y'] = _ewkb_end_point(geom)
+            x[i], y[i] = node['x'], node['y']
+        return x, y
+    
+    @timed('search')
     def find_exploration_path(self, 
                             cur,
                             start_vertex: int, 
@@ -79,44 +170,120 @@ class GraphManager:
                             avoid_vertices: List[int],
                             elevation_type: ElevationType,
                             prefer_hard_surface: bool,
-                            preferred_trail_type: TrailType) -> Dict:
-        """Find path that meets length criteria with lowest cost"""
+                            preferred_trail_type: TrailType,
+                            avoid_edges: Optional[List[Tuple[int, int]]] = None,
+                            trace: Optional[RouteTrace] = None) -> Dict:
+        """
+        Find path that meets length criteria with lowest cost.
+        Edges touching avoid_vertices, or reusing a segment in avoid_edges
+        (in either direction), are penalized with AVOID_PENALTY.
+        If a trace is given, sampled relaxations and the winning path's cost
+        breakdown are recorded on it.
+        """
+        
+        # Plain equal-weight requests are answered from the routes precomputed for this graph
+        if (explore_tree_store.serves(self.data_version) and not avoid_vertices and not avoid_edges
+                and trace is None and self._has_equal_weights(cost_weights)):
+            result = explore_tree_store.lookup(start_vertex, desired_length, tolerance, elevation_type,
+                                               prefer_hard_surface, preferred_trail_type)
+            if result is not None:
+                count('explore_tree_hits')
+                return result
+        
+        candidates = self._exploration_candidates(start_vertex, desired_length, cost_weights, tolerance,
+                                                  avoid_vertices, elevation_type, prefer_hard_surface,
+                                                  preferred_trail_type, avoid_edges, trace)
+            
+        # Find path with minimum cost
+        best_target = min(candidates, key=lambda k: candidates[k][0])
+        _, best_length, best_path = candidates[best_target]
         
+        if trace is not None:
+            trace.record_path(self._path_cost_breakdown('explore', best_path, cost_weights, elevation_type,
+                                                        prefer_hard_surface, preferred_trail_type))
+        
+        return {
+            'end_vertex': best_target,
+            'total_length': best_length,
+            'path': best_path
+        }
+    
+    @timed('search')
+    def find_exploration_alternatives(self,
+                                      cur,
+                                      start_vertex: int,
+                                      desired_length: float,
+                                      cost_weights: Dict[str, float],
+                                      tolerance: float,
+                                      avoid_vertices: List[int],
+                                      elevation_type: ElevationType,
+                                      prefer_hard_surface: bool,
+                                      preferred_trail_type: TrailType,
+                                      k: int = 5,
+                                      min_separation: Optional[float] = None,
+                                      avoid_edges: Optional[List[Tuple[int, int]]] = None) -> List[Dict]:
+        """
+        Up to k spatially diverse explore routes from a single shortest-path tree, cheapest first.
+        End vertices are clustered on their LV95 coordinates into cells of min_separation
+        (default: a quarter of the desired length); the cheapest end per cell is a candidate and
+        candidates closer than min_separation to an already chosen end are skipped.
+        Serves "shuffle" and "show alternatives" without a new search per route.
+        The first route is the cheapest end of this live search, the one find_exploration_path
+        picks when it searches too. This method never reads the explore store, so when
+        find_exploration_path serves a request from the store its route is only expected to
+        match, not guaranteed to.
+        cur is unused, coordinates come from the graph.
+        """
+        candidates = self._exploration_candidates(start_vertex, desired_length, cost_weights, tolerance,
+                                                  avoid_vertices, elevation_type, prefer_hard_surface,
+                                                  preferred_trail_type, avoid_edges)
+        if min_separation is None:
+            min_separation = desired_length * 0.25
+        
+        targets = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        costs = np.array([candidates[target][0] for target in targets.tolist()])
+        x, y = self.vertex_coordinates(targets.tolist())
+        
+        # Cheapest end per grid cell, cells in order of their cheapest end
+        order = np.argsort(costs, kind='stable')
+        cells = np.stack([np.floor(x / min_separation), np.floor(y / min_separation)], axis=1)[order]
+        _, first = np.unique(cells, axis=0, return_index=True)
+        cell_best = order[np.sort(first)]
+        
+        chosen = []
+        for i in cell_best:
+            if len(chosen) >= k:
+                break
+            if all(math.hypot(x[i] - x[j], y[i] - y[j]) >= min_separation for j in chosen):
+                chosen.append(i)
+        
+        return [
+            {
+                'end_vertex': int(targets[i]),
+                'total_length': candidates[int(targets[i])][1],
+                'path': candidates[int(targets[i])][2]
+            }
+            for i in chosen
+        ]
+    
+    def _exploration_candidates(self,
+                                start_vertex: int,
+                                desired_length: float,
+                                cost_weights: Dict[str, float],
+                                tolerance: float,
+                                avoid_vertices: List[int],
+                                elevation_type: ElevationType,
+                                prefer_hard_surface: bool,
+                                preferred_trail_type: TrailType,
+                                avoid_edges: Optional[List[Tuple[int, int]]] = None,
+                                trace: Optional[RouteTrace] = None) -> Dict[int, Tuple[float, float, List[int]]]:
+        """Every explore target within the length range as target -> (cost, length, path)"""
         min_length = desired_length * (1 - tolerance)
         max_length = desired_length * (1 + tolerance)
         
-        def cost_function(u, v, d):
-            # Calculate individual costs
-            elevation_cost = self._calculate_elevation_cost(d, elevation_type)
-            surface_cost = self._calculate_surface_cost({'surface': d.get('surface'), 
-                                                       'prefer_hard_surface': prefer_hard_surface})
-            trail_cost = self._calculate_trail_cost({'trail_type': d.get('trail_type'), 
-                                                       'preferred_trail_type': preferred_trail_type})
-            
-            # Calculate weighted sum
-            weighted_cost = (
-                cost_weights.get('elevation', 1.0) * elevation_cost +
-                cost_weights.get('surface', 0.0) * surface_cost +
-                cost_weights.get('trail', 0.0) * trail_cost
-            )
-            
-            # Apply avoidance penalty if needed
-            if avoid_vertices and (u in avoid_vertices or v in avoid_vertices):
-                weighted_cost *= 10
-            
-            # Log detailed cost breakdown
-            print(f"\nExplore Edge {u}->{v}:")
-            print(f"  Optimization type: {elevation_type.name}")
-            print(f"  Elevation diff: {d.get('elevation_diff', 0)}")
-            print(f"  Surface type: {d.get('surface')}")
-            print(f"  Trail type: {d.get('trail_type')}")
-            print(f"  Costs:")
-            print(f"    Elevation: {elevation_cost} (weight: {cost_weights.get('elevation', 1.0)})")
-            print(f"    Surface: {surface_cost} (weight: {cost_weights.get('surface', 0.0)})")
-            print(f"    Trail: {trail_cost} (weight: {cost_weights.get('trail', 0.0)})")
-            print(f"    Final weighted cost: {weighted_cost}")
-            
-            return max(0.000001, weighted_cost)
+        relaxations = {'edges': 0}
+        cost_function = self._explore_cost_function(cost_weights, avoid_vertices, elevation_type, prefer_hard_surface,
+                                                    preferred_trail_type, avoid_edges, trace, relaxations)
         
         # Use ego_graph to get subgraph within max_length distance
         subgraph = nx.ego_graph(
@@ -133,27 +300,296 @@ class GraphManager:
             weight=cost_function,
             cutoff=max_length
         )
+        count('edges_relaxed', relaxations['edges'])
+        count('settled_vertices', len(distances))
         
-        # Filter paths within desired length range
-        valid_paths = {}
-        for target, path in paths.items():
-            path_length = self._calculate_path_length(path)
-            if min_length <= path_length <= max_length:
-                valid_paths[target] = (distances[target], path)
+        # Filter paths within desired length range, lengths accumulated along the tree
+        lengths = self._tree_lengths(paths)
+        candidates = {
+            target: (distances[target], lengths[target], path)
+            for target, path in paths.items()
+            if min_length <= lengths[target] <= max_length
+        }
         
-        if not valid_paths:
+        if not candidates:
             raise ValueError(f"No paths found within length range {min_length}-{max_length}")
+        return candidates
+    
+    @staticmethod
+    def _has_equal_weights(cost_weights: Dict[str, float]) -> bool:
+        """
+        Whether the weights are exactly those the explore routes were precomputed with.
+        Scaled equal weights rank edges alike but move the cost cutoff, so they don't qualify.
+        """
+        weights = [cost_weights.get('elevation', 1.0), cost_weights.get('surface', 0.0), cost_weights.get('trail', 0.0)]
+        return weights == [1.0, 1.0, 1.0]
+    
+    def _explore_cost_function(self,
+                               cost_weights: Dict[str, float],
+                               avoid_vertices: List[int],
+                               elevation_type: ElevationType,
+                               prefer_hard_surface: bool,
+                               preferred_trail_type: TrailType,
+                               avoid_edges: Optional[List[Tuple[int, int]]],
+                               trace: Optional[RouteTrace],
+                               relaxations: Dict[str, int]):
+        """
+        Dijkstra weight for the explore searches. Edges touching avoid_vertices, or
+        reusing a segment in avoid_edges (in either direction), are penalized with
+        AVOID_PENALTY. Relaxations are counted in relaxations['edges'].
+        """
+        # O(1) membership tests per relaxation instead of scanning the avoid list
+        vertex_index = self._get_vertex_index()
+        avoid_mask = self._avoidance_mask(avoid_vertices)
+        avoid_edge_set = self._avoidance_edge_set(avoid_edges)
+        
+        tracing = trace is not None and trace.sampling
+        
+        def cost_function(u, v, d):
+            relaxations['edges'] += 1
+            elevation_cost, surface_cost, trail_cost, weighted_cost = self._edge_cost_breakdown(
+                d, cost_weights, elevation_type, prefer_hard_surface, preferred_trail_type
+            )
             
-        # Find path with minimum cost
-        best_target = min(valid_paths.keys(), key=lambda k: valid_paths[k][0])
-        best_cost, best_path = valid_paths[best_target]
+            # Apply avoidance penalty if needed
+            if avoid_mask is not None and (avoid_mask[vertex_index[u]] or avoid_mask[vertex_index[v]]):
+                weighted_cost *= self.AVOID_PENALTY
+            elif avoid_edge_set and (u, v) in avoid_edge_set:
+                weighted_cost *= self.AVOID_PENALTY
+            
+            if tracing and trace.sample():
+                trace.record_edge('explore', u, v, d, elevation_cost, surface_cost, trail_cost, weighted_cost)
+            
+            return max(0.000001, weighted_cost)
+        
+        return cost_function
+    
+    @timed('search')
+    def find_duration_path(self,
+                           start_vertex: int,
+                           min_minutes: float,
+                           max_minutes: float,
+                           cost_weights: Dict[str, float],
+                           avoid_vertices: List[int],
+                           elevation_type: ElevationType,
+                           prefer_hard_surface: bool,
+                           preferred_trail_type: TrailType,
+                           avoid_edges: Optional[List[Tuple[int, int]]] = None,
+                           trace: Optional[RouteTrace] = None) -> Dict:
+        """
+        Explore mode with a walking time budget ("hike for 2-3 hours").
+        The search is bounded by accumulated Tobler time instead of meters and the
+        lowest-cost path whose walking time lies within [min_minutes, max_minutes] wins.
+        """
+        self._ensure_edge_minutes()
+        
+        relaxations = {'edges': 0}
+        cost_function = self._explore_cost_function(cost_weights, avoid_vertices, elevation_type, prefer_hard_surface,
+                                                     preferred_trail_type, avoid_edges, trace, relaxations)
+        
+        # Every vertex reachable within the time budget, like the ego_graph radius in meters
+        reachable = nx.single_source_dijkstra_path_length(self.G, start_vertex, cutoff=max_minutes, weight='minutes')
+        subgraph = self.G.subgraph(reachable)
+        
+        distances, paths = nx.single_source_dijkstra(subgraph, start_vertex, weight=cost_function)
+        count('edges_relaxed', relaxations['edges'])
+        count('settled_vertices', len(distances))
+        
+        # Walking time of every tree path, accumulated from the parent in one pass
+        minutes = self._tree_lengths(paths, weight='minutes')
+        valid_targets = [target for target in paths if min_minutes <= minutes[target] <= max_minutes]
+        if not valid_targets:
+            raise ValueError(f"No paths found within duration range {min_minutes}-{max_minutes} minutes")
+        
+        best_target = min(valid_targets, key=lambda k: distances[k])
+        best_path = paths[best_target]
+        
+        if trace is not None:
+            trace.record_path(self._path_cost_breakdown('explore', best_path, cost_weights, elevation_type,
+                                                        prefer_hard_surface, preferred_trail_type))
         
         return {
             'end_vertex': best_target,
             'total_length': self._calculate_path_length(best_path),
+            'total_minutes': round(minutes[best_target], 1),
             'path': best_path
         }
     
+    @timed('search')
+    def find_pareto_paths(self,
+                          start_vertex: int,
+                          desired_length: float,
+                          tolerance: float,
+                          elevation_type: ElevationType,
+                          prefer_hard_surface: bool,
+                          preferred_trail_type: TrailType,
+                          max_labels_per_vertex: int = 4,
+                          max_routes: int = 8) -> List[Dict]:
+        """
+        Multi-criteria label-setting search over elevation, surface and trail cost plus length.
+        Returns a small Pareto set of explore routes (ending within the length tolerance) with
+        their unweighted cost components, so any slider setting can be answered with
+        select_pareto_route instead of a new search. Each vertex keeps at most
+        max_labels_per_vertex non-dominated labels and labels longer than the range are pruned.
+        """
+        min_length = desired_length * (1 - tolerance)
+        max_length = desired_length * (1 + tolerance)
+        
+        # Label: (elevation, surface, trail, length, vertex, parent label)
+        labels = [(0.0, 0.0, 0.0, 0.0, start_vertex, -1)]
+        alive = [True]
+        vertex_labels = {start_vertex: [0]}
+        heap = [(0.0, 0.0, 0)]
+        edge_costs = {}
+        edges_relaxed = 0
+        
+        def dominates(a, b) -> bool:
+            return a[0] <= b[0] and a[1] <= b[1] and a[2] <= b[2] and a[3] <= b[3]
+        
+        while heap:
+            _, _, i = heapq.heappop(heap)
+            if not alive[i]:
+                continue
+            elevation, surface, trail, length, u, _ = labels[i]
+            
+            for v, d in self.G[u].items():
+                new_length = length + d['length']
+                if new_length > max_length:
+                    continue
+                edges_relaxed += 1
+                costs = edge_costs.get((u, v))
+                if costs is None:
+                    costs = edge_costs[(u, v)] = self._edge_cost_breakdown(
+                        d, {}, elevation_type, prefer_hard_surface, preferred_trail_type)[:3]
+                candidate = (elevation + costs[0], surface + costs[1], trail + costs[2], new_length, v, i)
+                
+                existing = vertex_labels.get(v, [])
+                if any(dominates(labels[j], candidate) for j in existing):
+                    continue
+                survivors = []
+                for j in existing:
+                    if dominates(candidate, labels[j]):
+                        alive[j] = False
+                    else:
+                        survivors.append(j)
+                if len(survivors) >= max_labels_per_vertex:
+                    vertex_labels[v] = survivors
+                    continue
+                
+                labels.append(candidate)
+                alive.append(True)
+                survivors.append(len(labels) - 1)
+                vertex_labels[v] = survivors
+                heapq.heappush(heap, (candidate[0] + candidate[1] + candidate[2], new_length, len(labels) - 1))
+        
+        count('edges_relaxed', edges_relaxed)
+        count('settled_vertices', len(vertex_labels))
+        
+        # Pareto set over the three costs among labels ending within the length range
+        ends = [i for i, label in enumerate(labels)
+                if alive[i] and label[4] != start_vertex and min_length <= label[3] <= max_length]
+        # In ascending cost-sum order a label can only be dominated by one already on the front
+        front = []
+        for i in sorted(ends, key=lambda k: sum(labels[k][:3])):
+            if not any(all(a <= b for a, b in zip(labels[j][:3], labels[i][:3])) for j in front):
+                front.append(i)
+        if not front:
+            raise ValueError(f"No paths found within length range {min_length}-{max_length}")
+        
+        # Keep the best route for every weight setting of a coarse grid first, then the cheapest rest
+        chosen = []
+        for weights in PARETO_WEIGHT_GRID:
+            best = min(front, key=lambda k: sum(w * c for w, c in zip(weights, labels[k][:3])))
+            if best not in chosen:
+                chosen.append(best)
+        for i in front:
+            if len(chosen) >= max_routes:
+                break
+            if i not in chosen:
+                chosen.append(i)
+        
+        routes = []
+        for i in chosen[:max_routes]:
+            path = []
+            j = i
+            while j >= 0:
+                path.append(labels[j][4])
+                j = labels[j][5]
+            path.reverse()
+            routes.append({
+                'end_vertex': labels[i][4],
+                'total_length': labels[i][3],
+                'costs': {'elevation': labels[i][0], 'surface': labels[i][1], 'trail': labels[i][2]},
+                'path': path
+            })
+        return routes
+    
+    def _ensure_edge_minutes(self) -> None:
+        """
+        Store the Tobler walking time in minutes on every edge once per graph, so duration
+        searches read a ready attribute. Edges shorter than 10 cm have no duration and count as 0.
+        """
+        if self._edge_minutes_count == self.G.number_of_edges():
+            return
+        for _, _, d in self.G.edges(data=True):
+            d['minutes'] = (d.get('duration') or 0.0) / 60.0
+        self._edge_minutes_count = self.G.number_of_edges()
+    
+    def network_distances(self, start_vertex: int, max_distance: float) -> Dict[int, float]:
+        """Trail distance (by length) from start_vertex to every vertex within max_distance"""
+        return nx.single_source_dijkstra_path_length(
+            self.G,
+            start_vertex,
+            cutoff=max_distance,
+            weight='length'
+        )
+    
+    def _get_vertex_index(self) -> Dict[int, int]:
+        """Map every vertex to a dense position, used to address per-vertex bitsets"""
+        if self._vertex_index is None or len(self._vertex_index) != self.G.number_of_nodes():
+            self._vertex_index = {vertex: i for i, vertex in enumerate(self.G.nodes)}
+        return self._vertex_index
+    
+    def get_edge_arrays(self) -> EdgeArrays:
+        """Edge attributes as NumPy arrays, built once per graph"""
+        if self._edge_arrays is None or len(self._edge_arrays.length) != self.G.number_of_edges():
+            self._edge_arrays = EdgeArrays.from_graph(self.G)
+        return self._edge_arrays
+    
+    def route_statistics(self, path: List[int]) -> Dict:
+        """Distance, elevation, duration, surface and trail type aggregates of a vertex path"""
+        edge_arrays = self.get_edge_arrays()
+        return route_statistics(edge_arrays, edge_arrays.path_edges(path))
+    
+    def _avoidance_mask(self, avoid_vertices: Optional[List[int]]) -> Optional[np.ndarray]:
+        """Bitmask over the vertex index with the avoided vertices set"""
+        if not avoid_vertices:
+            return None
+        vertex_index = self._get_vertex_index()
+        mask = np.zeros(len(vertex_index), dtype=bool)
+        mask[[vertex_index[v] for v in avoid_vertices if v in vertex_index]] = True
+        return mask
+    
+    def _avoidance_edge_set(self, avoid_edges: Optional[List[Tuple[int, int]]]) -> set:
+        """Avoided segments in both directions, since every trail is stored as two edges"""
+        if not avoid_edges:
+            return set()
+        return {(u, v) for u, v in avoid_edges} | {(v, u) for u, v in avoid_edges}
+    
+    def _tree_lengths(self, paths: Dict[int, List[int]], reverse: bool = False,
+                      weight: str = 'length') -> Dict[int, float]:
+        """Length (or another additive edge attribute) of every path of a shortest-path tree, accumulated from the parent"""
+        lengths = {}
+        for target in sorted(paths, key=lambda k: len(paths[k])):
+            path = paths[target]
+            if len(path) == 1:
+                lengths[target] = 0.0
+                continue
+            u, v = path[-2], path[-1]
+            edge = self.G[v][u] if reverse else self.G[u][v]
+            lengths[target] = lengths[u] + edge[weight]
+        return lengths
+    
     def _calculate_path_length(self, path: List[int]) -> float:
         """Calculate total length of a path"""
         return sum(
@@ -215,6 +651,7 @@ class GraphManager:
         else:
             return 1.0
     
+    @timed('search')
     def find_path_to_target(self,
                            start_vertex: int,
                            target_vertex: int,
@@ -222,35 +659,22 @@ class GraphManager:
                            search_radius: float,
                            elevation_type: ElevationType,
                            prefer_hard_surface: bool,
-                           preferred_trail_type: TrailType) -> Dict:
+                           preferred_trail_type: TrailType,
+                           trace: Optional[RouteTrace] = None) -> Dict:
         """Find shortest path between two vertices using custom cost function"""
         
+        tracing = trace is not None and trace.sampling
+        edges_relaxed = 0
+        
         def cost_function(u, v, d):
-            # Calculate individual costs
-            elevation_cost = self._calculate_elevation_cost(d, elevation_type)
-            surface_cost = self._calculate_surface_cost({'surface': d.get('surface'), 
-                                                       'prefer_hard_surface': prefer_hard_surface})
-            trail_cost = self._calculate_trail_cost({'trail_type': d.get('trail_type'), 
-                                                   'preferred_trail_type': preferred_trail_type})
-            
-            # Calculate weighted sum
-            weighted_cost = (
-                cost_weights.get('elevation', 1.0) * elevation_cost +
-                cost_weights.get('surface', 0.0) * surface_cost +
-                cost_weights.get('trail', 0.0) * trail_cost
+            nonlocal edges_relaxed
+            edges_relaxed += 1
+            elevation_cost, surface_cost, trail_cost, weighted_cost = self._edge_cost_breakdown(
+                d, cost_weights, elevation_type, prefer_hard_surface, preferred_trail_type
             )
             
-            # Log detailed cost breakdown
-            print(f"\nBounce Edge {u}->{v}:")
-            print(f"  Optimization type: {elevation_type.name}")
-            print(f"  Elevation diff: {d.get('elevation_diff', 0)}")
-            print(f"  Surface type: {d.get('surface')}")
-            print(f"  Trail type: {d.get('trail_type')}")
-            print(f"  Costs:")
-            print(f"    Elevation: {elevation_cost} (weight: {cost_weights.get('elevation', 1.0)})")
-            print(f"    Surface: {surface_cost} (weight: {cost_weights.get('surface', 0.0)})")
-            print(f"    Trail: {trail_cost} (weight: {cost_weights.get('trail', 0.0)})")
-            print(f"    Final weighted cost: {weighted_cost}")
+            if tracing and trace.sample():
+                trace.record_edge('bounce', u, v, d, elevation_cost, surface_cost, trail_cost, weighted_cost)
             
             return max(0.000001, weighted_cost)
         
@@ -273,6 +697,11 @@ class GraphManager:
                 target=target_vertex,
                 weight=cost_function
             )
+            count('edges_relaxed', edges_relaxed)
+            
+            if trace is not None:
+                trace.record_path(self._path_cost_breakdown('bounce', path, cost_weights, elevation_type,
+                                                            prefer_hard_surface, preferred_trail_type))
             
             return {
                 'end_vertex': target_vertex,
@@ -281,4 +710,130 @@ class GraphManager:
             }
             
         except nx.NetworkXNoPath:
-            raise ValueError(f"No path found between vertices {start_vertex} and {target_vertex}")
\ No newline at end of file
+            raise ValueError(f"No path found between vertices {start_vertex} and {target_vertex}")
+    
+    @timed('search')
+    def find_round_trip_path(self,
+                             start_vertex: int,
+                             desired_length: float,
+                             cost_weights: Dict[str, float],
+                             tolerance: float,
+                             elevation_type: ElevationType,
+                             prefer_hard_surface: bool,
+                             preferred_trail_type: TrailType,
+                             overlap_penalty: float = 2.0,
+                             max_candidates: int = 200) -> Dict:
+        """
+        Find a loop of the desired length starting and ending at start_vertex.
+        One forward tree (start -> v) and one reverse tree (v -> start) are grown over
+        the same subgraph; every vertex is a possible turnaround point joining both
+        halves. The cheapest candidates are then penalized by the share of the return
+        half that reuses vertices of the outbound half (tracked in a bitset).
+        """
+        min_length = desired_length * (1 - tolerance)
+        max_length = desired_length * (1 + tolerance)
+        
+        edges_relaxed = 0
+        
+        def cost_function(u, v, d):
+            nonlocal edges_relaxed
+            edges_relaxed += 1
+            return self._weighted_edge_cost(d, cost_weights, elevation_type,
+                                            prefer_hard_surface, preferred_trail_type)
+        
+        # A turnaround point is never further away than the longer half of the loop
+        subgraph = nx.ego_graph(
+            self.G,
+            start_vertex,
+            radius=max_length * 0.6,
+            distance='length'
+        )
+        
+        forward_costs, forward_paths = nx.single_source_dijkstra(subgraph, start_vertex, weight=cost_function)
+        reverse_costs, reverse_paths = nx.single_source_dijkstra(
+            subgraph.reverse(copy=False), start_vertex, weight=cost_function
+        )
+        count('edges_relaxed', edges_relaxed)
+        count('settled_vertices', len(forward_costs) + len(reverse_costs))
+        forward_lengths = self._tree_lengths(forward_paths)
+        reverse_lengths = self._tree_lengths(reverse_paths, reverse=True)
+        
+        candidates = [
+            v for v in forward_paths
+            if v != start_vertex and v in reverse_paths
+            and min_length <= forward_lengths[v] + reverse_lengths[v] <= max_length
+        ]
+        if not candidates:
+            raise ValueError(f"No round trip found within length range {min_length}-{max_length}")
+        
+        candidates.sort(key=lambda v: forward_costs[v] + reverse_costs[v])
+        
+        vertex_index = self._get_vertex_index()
+        outbound = np.zeros(len(vertex_index), dtype=bool)
+        best_vertex, best_score = None, math.inf
+        for v in candidates[:max_candidates]:
+            forward_rows = [vertex_index[u] for u in forward_paths[v][1:-1]]
+            return_rows = [vertex_index[u] for u in reverse_paths[v][1:-1]]
+            outbound[forward_rows] = True
+            overlap = outbound[return_rows].sum() / len(return_rows) if return_rows else 0.0
+            outbound[forward_rows] = False
+            
+            score = (forward_costs[v] + reverse_costs[v]) * (1 + overlap_penalty * overlap)
+            if score < best_score:
+                best_vertex, best_score = v, score
+        
+        path = forward_paths[best_vertex] + reverse_paths[best_vertex][::-1][1:]
+        
+        return {
+            'end_vertex': start_vertex,
+            'turnaround_vertex': best_vertex,
+            'total_length': forward_lengths[best_vertex] + reverse_lengths[best_vertex],
+            'path': path
+        }
+    
+    def _edge_cost_breakdown(self,
+                             d: Dict,
+                             cost_weights: Dict[str, float],
+                             elevation_type: ElevationType,
+                             prefer_hard_surface: bool,
+                             preferred_trail_type: TrailType) -> Tuple[float, float, float, float]:
+        """Elevation, surface and trail cost of a single edge and their weighted sum"""
+        elevation_cost = self._calculate_elevation_cost(d, elevation_type)
+        surface_cost = self._calculate_surface_cost({'surface': d.get('surface'), 
+                                                   'prefer_hard_surface': prefer_hard_surface})
+        trail_cost = self._calculate_trail_cost({'trail_type': d.get('trail_type'), 
+                                               'preferred_trail_type': preferred_trail_type})
+        
+        weighted_cost = (
+            cost_weights.get('elevation', 1.0) * elevation_cost +
+            cost_weights.get('surface', 0.0) * surface_cost +
+            cost_weights.get('trail', 0.0) * trail_cost
+        )
+        return elevation_cost, surface_cost, trail_cost, weighted_cost
+    
+    def _weighted_edge_cost(self,
+                            d: Dict,
+                            cost_weights: Dict[str, float],
+                            elevation_type: ElevationType,
+                            prefer_hard_surface: bool,
+                            preferred_trail_type: TrailType) -> float:
+        """Weighted sum of elevation, surface and trail cost of a single edge"""
+        weighted_cost = self._edge_cost_breakdown(d, cost_weights, elevation_type,
+                                                  prefer_hard_surface, preferred_trail_type)[3]
+        return max(0.000001, weighted_cost)
+    
+    def _path_cost_breakdown(self,
+                             search: str,
+                             path: List[int],
+                             cost_weights: Dict[str, float],
+                             elevation_type: ElevationType,
+                             prefer_hard_surface: bool,
+                             preferred_trail_type: TrailType) -> List[Dict]:
+        """Cost breakdown (without avoidance penalties) of every edge along a path"""
+        breakdown = []
+        for u, v in zip(path[:-1], path[1:]):
+            d = self.G[u][v]
+            costs = self._edge_cost_breakdown(d, cost_weights, elevation_type,
+                                              prefer_hard_surface, preferred_trail_type)
+            breakdown.append(edge_breakdown(search, u, v, d, *costs))
+        return breakdown
@@ -0,0 +1,130 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+# Stages of a /hike request, in pipeline order
+STAGES = [
+    'station_selection',
+    'nearest_stations',
+    'isochrone',
+    'poi_filter',
+    'vertex_snapping',
+    'bounce_candidates',
+    'search',
+    'end_stop',
+    'geojson',
+    'total'
+]
+
+# Latency buckets in seconds for the stage histograms
+BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+class MetricsRegistry:
+    """Process-wide stage latencies and counters, exported in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stage_seconds.setdefault(stage, Histogram()).observe(seconds)
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def render_prometheus(self) -> str:
+        """Render all metrics for a /metrics endpoint"""
+        lines = [
+            "# HELP gowandr_stage_duration_seconds Latency of each /hike pipeline stage",
+            "# TYPE gowandr_stage_duration_seconds histogram"
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self.stage_seconds.items()):
+                for bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f'gowandr_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+                lines.append(f'gowandr_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'gowandr_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'gowandr_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE gowandr_{name}_total counter")
+                lines.append(f"gowandr_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+class RequestMetrics:
+    """Stage timings and counters of a single request, e.g. to attach to the response"""
+
+    def __init__(self):
+        self.stage_seconds: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+
+    def to_dict(self) -> Dict:
+        return {
+            'stage_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self.stage_seconds.items()},
+            'counters': dict(self.counters)
+        }
+
+registry = MetricsRegistry()
+_current_request: ContextVar[Optional[RequestMetrics]] = ContextVar('current_request_metrics', default=None)
+
+@contextmanager
+def request_metrics():
+    """Collect metrics for everything that runs inside the block as one request"""
+    metrics = RequestMetrics()
+    token = _current_request.set(metrics)
+    try:
+        with span('total'):
+            yield metrics
+    finally:
+        _current_request.reset(token)
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage; repeated spans of the same stage within a request add up"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe_stage(stage, seconds)
+        metrics = _current_request.get()
+        if metrics is not None:
+            metrics.stage_seconds[stage] = metrics.stage_seconds.get(stage, 0.0) + seconds
+
+def count(name: str, value: float = 1) -> None:
+    """Increment a counter globally and for the current request"""
+    registry.inc(name, value)
+    metrics = _current_request.get()
+    if metrics is not None:
+        metrics.counters[name] = metrics.counters.get(name, 0) + value
+
+def timed(stage: str):
+    """Decorator form of span() for functions that make up a whole stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,102 +1,68 @@
-from models import POIPreferences, LakeSize, UrbanSize
-from db import get_db_connection
+from models import POIPreferences
+from db_pool import pooled_cursor
+from stop_poi_index import stop_poi_index
+from metrics import timed
 
-def filter_by_lake(cur, stations, lake_preferences):
-    if not lake_preferences:
-        return stations
-
-    # Extract station IDs from the list of stations
-    station_ids = [station[0] for station in stations]
-
-    # Execute a single query to get all matching station IDs
-    cur.execute("""
-        SELECT DISTINCT stop_id
-        FROM stop_has_poi
-        WHERE stop_id = ANY(%s)
-        AND poi_type = 'lake'
-        AND poi_distance <= %s
-        AND poi_size_closest = ANY(%s)
-    """, (
-        station_ids,
-        lake_preferences.lake_distance,
-        [size.value for size in lake_preferences.lake_sizes]
-    ))
-
-    # Fetch the matching station IDs
-    matching_station_ids = set(row[0] for row in cur.fetchall())
-
-    # Filter the original stations list based on matching IDs
-    filtered_stations = [station for station in stations if station[0] in matching_station_ids]
-
-    return filtered_stations
-
-
-def filter_by_urban(cur, stations, urban_preferences):
-    """
-    Filter stations based on urban avoidance preferences.
-    Returns filtered list of stations that match urban criteria.
-    """
-    if not urban_preferences:
-        return stations
-
-    filtered_stations = []
-    for station in stations:
-        station_id = station[0]
-        cur.execute("""
-            SELECT 1
-            FROM stop_has_poi
-            WHERE stop_id = %s 
-            AND poi_type = 'urban'
-            AND (
-                poi_size_cumulated IN ('S', 'M', 'L')
-                OR poi_distance IS NULL
-                OR poi_distance > %s
-            )
-        """, (
-            station_id,
-            urban_preferences.urban_distance
-        ))
-        if cur.fetchone():
-            filtered_stations.append(station)
-    
-    return filtered_stations
-
-def filter_by_restaurant(cur, stations, restaurant_preferences):
+def filter_by_poi(cur, stations, poi_preferences):
     """
-    Filter stations based on restaurant/guesthouse preferences.
-    Returns filtered list of stations that match restaurant criteria.
+    Filter stations based on all enabled POI preferences (lake, urban avoidance,
+    restaurant/guesthouse) in a single query for the whole candidate list.
+    Returns filtered list of stations that match all enabled criteria.
     """
-    if not restaurant_preferences:
-        return stations
-
     # Extract station IDs from the list of stations
     station_ids = [station[0] for station in stations]
 
-    # Execute query to get stations with required restaurant density
+    # Every criterion is a bool_or over the stop's POI rows; disabled criteria are
+    # short-circuited by their flag so the query shape stays the same for all requests
     cur.execute("""
-        SELECT DISTINCT stop_id
+        SELECT stop_id
         FROM stop_has_poi
-        WHERE stop_id = ANY(%s)
-        AND poi_type = 'restaurant_guesthouse'
-        AND poi_distance <= %s
-        AND poi_density >= %s
-    """, (
-        station_ids,
-        restaurant_preferences.restaurant_distance,
-        restaurant_preferences.min_restaurant_density
-    ))
+        WHERE stop_id = ANY(%(station_ids)s)
+        GROUP BY stop_id
+        HAVING
+            (NOT %(lake)s OR bool_or(
+                poi_type = 'lake'
+                AND poi_distance <= %(lake_distance)s
+                AND poi_size_closest = ANY(%(lake_sizes)s)
+            ))
+            AND (NOT %(avoid_urban)s OR bool_or(
+                poi_type = 'urban'
+                AND (
+                    poi_size_cumulated IN ('S', 'M', 'L')
+                    OR poi_distance IS NULL
+                    OR poi_distance > %(urban_distance)s
+                )
+            ))
+            AND (NOT %(restaurant)s OR bool_or(
+                poi_type = 'restaurant_guesthouse'
+                AND poi_distance <= %(restaurant_distance)s
+                AND poi_density >= %(min_restaurant_density)s
+            ))
+    """, {
+        'station_ids': station_ids,
+        'lake': bool(poi_preferences.lake),
+        'lake_distance': poi_preferences.lake_distance,
+        # Only read when the lake criterion is on, the sizes may be unset otherwise
+        'lake_sizes': [size.value for size in poi_preferences.lake_sizes or []] if poi_preferences.lake else [],
+        'avoid_urban': bool(poi_preferences.avoid_urban),
+        'urban_distance': poi_preferences.urban_distance,
+        'restaurant': bool(poi_preferences.restaurant),
+        'restaurant_distance': poi_preferences.restaurant_distance,
+        'min_restaurant_density': poi_preferences.min_restaurant_density
+    })
 
     # Fetch the matching station IDs
     matching_station_ids = set(row[0] for row in cur.fetchall())
 
     # Filter the original stations list based on matching IDs
-    filtered_stations = [station for station in stations if station[0] in matching_station_ids]
+    return [station for station in stations if station[0] in matching_station_ids]
 
-    return filtered_stations
-
-def find_poi(start_stations, poi_preferences: POIPreferences = None):
+@timed('poi_filter')
+def find_poi(start_stations, poi_preferences: POIPreferences = None, cur=None):
     """
     Filter stations based on POI preferences.
+    Uses the in-memory stop POI index when it is loaded, otherwise queries
+    stop_has_poi with the caller's cursor (or a pooled one).
     Returns filtered list of stations that match POI criteria.
     """
     if not poi_preferences:
@@ -106,27 +72,18 @@ def find_poi(start_stations, poi_preferences: POIPreferences = None):
         return start_stations
 
     print(f"Finding POIs with preferences: {poi_preferences}")
-    filtered_stations = start_stations.copy()
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    try:
-        # Check lake criteria if enabled
-        if poi_preferences.lake:
-            filtered_stations = filter_by_lake(cur, filtered_stations, poi_preferences)
 
-        # Check urban avoidance criteria if enabled
-        if poi_preferences.avoid_urban:
-            filtered_stations = filter_by_urban(cur, filtered_stations, poi_preferences)
-            
-        # Check restaurant criteria if enabled
-        if poi_preferences.restaurant:
-            filtered_stations = filter_by_restaurant(cur, filtered_stations, poi_preferences)
+    if stop_poi_index.loaded:
+        filtered_stations = stop_poi_index.filter(start_stations, poi_preferences)
+        print(f"Found {len(filtered_stations)} stations matching POI criteria")
+        return filtered_stations
 
+    if cur is not None:
+        filtered_stations = filter_by_poi(cur, start_stations, poi_preferences)
         print(f"Found {len(filtered_stations)} stations matching POI criteria")
         return filtered_stations
 
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+    with pooled_cursor() as cur:
+        filtered_stations = filter_by_poi(cur, start_stations, poi_preferences)
+        print(f"Found {len(filtered_stations)} stations matching POI criteria")
+        return filtered_stations
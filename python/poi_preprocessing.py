@@ -0,0 +1,404 @@
+"""
+Parallel, tiled POI preprocessing for stop_has_poi, vertex_has_poi and edge_has_poi.
+
+Replaces the CALL calculate_*_poi_metrics procedures: every type in the POI
+registry is transformed to LV95 and indexed once, the target table is split into
+spatial tiles, and every tile is computed with KNN nearest lookups on its own
+database connection.
+
+    python poi_preprocessing.py --dsn "dbname=gowandr" --workers 8 --tiles 16
+    python poi_preprocessing.py --dsn "dbname=gowandr" --incremental   # after an OSM re-import
+"""
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import sql
+
+from poi_registry import DEFAULT_POI_TYPES, POI_REGISTRY, POIType, SIZE_CATEGORIES
+from routing_snapshot import export_snapshot
+
+# Network elements that get POI attributes, every registered POI type is computed for each
+TARGETS = {
+    'stops': {
+        'table': 'stops', 'id': 'xtf_id', 'geom': 'geom',
+        'poi_table': 'stop_has_poi', 'poi_id': 'stop_id'
+    },
+    'vertices': {
+        'table': 'wanderwege_vertices_3', 'id': 'vertex_id', 'geom': 'vertex',
+        'poi_table': 'vertex_has_poi', 'poi_id': 'vertex_id'
+    },
+    'edges': {
+        'table': 'wanderwege_edges_3', 'id': 'id', 'geom': 'geom',
+        'poi_table': 'edge_has_poi', 'poi_id': 'edge_id'
+    },
+}
+
+def size_category_sql(poi_type: POIType, area: str) -> sql.Composable:
+    """CASE expression mapping an area to the type's size category"""
+    if not poi_type.size_thresholds:
+        return sql.SQL("NULL::text")
+    cases = [
+        sql.SQL("WHEN {area} < {threshold} THEN {category}").format(
+            area=sql.SQL(area), threshold=sql.Literal(threshold), category=sql.Literal(category))
+        for category, threshold in zip(SIZE_CATEGORIES, poi_type.size_thresholds)
+    ]
+    return sql.SQL("CASE WHEN {area} IS NULL THEN NULL {cases} ELSE {largest} END").format(
+        area=sql.SQL(area),
+        cases=sql.SQL(" ").join(cases),
+        largest=sql.Literal(SIZE_CATEGORIES[len(poi_type.size_thresholds)])
+    )
+
+def poi_source_query(poi_type: POIType) -> sql.Composed:
+    area = sql.SQL("way_area") if poi_type.size_thresholds else sql.SQL("NULL::float")
+    return sql.SQL("""
+        SELECT osm_id, {area} AS area, ST_Transform(way, 2056) AS geom
+        FROM {osm_table}
+        WHERE {osm_filter}
+    """).format(area=area, osm_table=sql.Identifier(poi_type.osm_table), osm_filter=sql.SQL(poi_type.osm_filter))
+
+def prepare_poi_tables(cur, poi_types: List[str], incremental: bool = False) -> List[str]:
+    """
+    Materialize each POI type in LV95 with a GiST index, so no tile transforms geometries.
+    In incremental mode the previous import is kept and the geometries that were added,
+    removed or moved are written to poi_<type>_changes. Both stay until finish_poi_tables
+    runs after every tile succeeded: if poi_<type>_changes still exists, the last run
+    failed: its import is replaced without touching poi_<type>_previous and the new diff
+    against that last completed import is added to the failed run's changes (a failed
+    full run is redone in full). Returns the POI types that have no previous import and
+    therefore need a full recomputation.
+    """
+    full_types = []
+    for poi_type in poi_types:
+        source = POI_REGISTRY[poi_type]
+        table = sql.Identifier(source.table)
+        previous = sql.Identifier(source.table + '_previous')
+        changes = sql.Identifier(source.table + '_changes')
+        print(f"Preparing {source.table}...")
+
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL",
+                    (source.table, source.table + '_previous', source.table + '_changes'))
+        has_current, has_previous_table, unfinished = cur.fetchone()
+        resume = incremental and unfinished and has_previous_table
+        if resume:
+            # Keep the last completed import as the baseline and the failed run's changes
+            print(f"Previous {poi_type} run did not finish, diffing against its baseline again")
+            has_previous = True
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(table))
+        elif incremental and unfinished:
+            print(f"Previous full {poi_type} run did not finish, recomputing it in full")
+            has_previous = False
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {}, {}").format(table, previous))
+            full_types.append(poi_type)
+        else:
+            has_previous = incremental and has_current
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(previous))
+            if has_previous:
+                cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(table, previous))
+            else:
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(table))
+                full_types.append(poi_type)
+
+        cur.execute(sql.SQL("CREATE TABLE {} AS {}").format(table, poi_source_query(source)))
+        cur.execute(sql.SQL("CREATE INDEX ON {} USING GIST (geom)").format(table))
+        cur.execute(sql.SQL("ANALYZE {}").format(table))
+
+        if has_previous:
+            # Compare by osm_id and a geometry hash, both the old and the new geometry of a moved POI count
+            if not resume:
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {changes}; CREATE TABLE {changes} (geom geometry)").format(
+                    changes=changes))
+            cur.execute(sql.SQL("""
+                INSERT INTO {changes}
+                SELECT p.geom FROM {previous} p
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table} t
+                    WHERE t.osm_id = p.osm_id AND md5(ST_AsEWKB(t.geom)) = md5(ST_AsEWKB(p.geom))
+                )
+                UNION ALL
+                SELECT t.geom FROM {table} t
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {previous} p
+                    WHERE p.osm_id = t.osm_id AND md5(ST_AsEWKB(p.geom)) = md5(ST_AsEWKB(t.geom))
+                )
+            """).format(changes=changes, previous=previous, table=table))
+            print(f"{cur.rowcount} changed {poi_type} geometries")
+            cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING GIST (geom)").format(
+                sql.Identifier(source.table + '_changes_geom_idx'), changes))
+            cur.execute(sql.SQL("ANALYZE {}").format(changes))
+        else:
+            # Empty change table, it only marks the run as unfinished until finish_poi_tables
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(changes))
+            cur.execute(sql.SQL("CREATE TABLE {} AS SELECT geom FROM {} LIMIT 0").format(changes, table))
+    return full_types
+
+def finish_poi_tables(cur, poi_types: List[str], targets: List[str]) -> None:
+    """Drop the incremental bookkeeping once every tile job succeeded"""
+    for poi_type in poi_types:
+        table = POI_REGISTRY[poi_type].table
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}, {}").format(
+            sql.Identifier(table + '_changes'), sql.Identifier(table + '_previous')))
+    for name in targets:
+        cur.execute(sql.SQL("TRUNCATE {}").format(sql.Identifier(TARGETS[name]['poi_table'] + '_refresh')))
+
+def sync_poi_rows(cur, target: Dict, poi_type: str, id_type: str) -> None:
+    """
+    Seed a row for every new element and drop rows of elements that no longer exist
+    (replaces the NOT IN inserts). New ids are recorded in <poi_table>_refresh so an
+    incremental run computes them even when no POI near them changed.
+    """
+    identifiers = {
+        'poi_table': sql.Identifier(target['poi_table']),
+        'poi_id': sql.Identifier(target['poi_id']),
+        'id': sql.Identifier(target['id']),
+        'id_type': sql.SQL(id_type),
+        'table': sql.Identifier(target['table']),
+        'refresh': sql.Identifier(target['poi_table'] + '_refresh')
+    }
+    cur.execute(sql.SQL("""
+        DELETE FROM {poi_table} h
+        WHERE h.poi_type = %s
+          AND NOT EXISTS (SELECT 1 FROM {table} t WHERE CAST(t.{id} AS {id_type}) = h.{poi_id})
+    """).format(**identifiers), (poi_type,))
+    cur.execute(sql.SQL("""
+        WITH seeded AS (
+            INSERT INTO {poi_table} ({poi_id}, poi_type)
+            SELECT CAST({id} AS {id_type}), %s FROM {table}
+            ON CONFLICT DO NOTHING
+            RETURNING {poi_id}, poi_type
+        )
+        INSERT INTO {refresh} (id, poi_type)
+        SELECT {poi_id}, poi_type FROM seeded
+    """).format(**identifiers), (poi_type,))
+
+def ensure_metric_columns(cur, target: Dict) -> None:
+    """vertex_has_poi and edge_has_poi were created with poi_distance only"""
+    for column, column_type in [('poi_density', 'INTEGER'), ('poi_size_closest', 'TEXT'),
+                                ('poi_size_cumulated', 'TEXT')]:
+        cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} {}").format(
+            sql.Identifier(target['poi_table']), sql.Identifier(column), sql.SQL(column_type)))
+
+def column_type(cur, table: str, column: str) -> str:
+    """SQL type of a column, the *_has_poi id columns are not typed consistently"""
+    cur.execute("""
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attname = %s
+    """, (table, column))
+    return cur.fetchone()[0]
+
+def make_tiles(cur, target: Dict, tiles: int) -> List[Tuple[float, float, float, float]]:
+    """Split the target's extent into a grid of roughly `tiles` half-open boxes"""
+    cur.execute(sql.SQL("""
+        SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+        FROM (SELECT ST_Extent({geom}) AS e FROM {table}) extent
+    """).format(geom=sql.Identifier(target['geom']), table=sql.Identifier(target['table'])))
+    xmin, ymin, xmax, ymax = cur.fetchone()
+    # ST_Extent of an empty table is NULL, there is nothing to tile
+    if xmin is None:
+        print(f"{target['table']} is empty, skipping")
+        return []
+    # Widen by a meter so elements on the max border fall into the last tile
+    xmax, ymax = xmax + 1, ymax + 1
+    side = max(1, math.ceil(math.sqrt(tiles)))
+    width, height = (xmax - xmin) / side, (ymax - ymin) / side
+    return [
+        (xmin + i * width, ymin + j * height, xmin + (i + 1) * width, ymin + (j + 1) * height)
+        for i in range(side) for j in range(side)
+    ]
+
+def tile_statement(target: Dict, poi_type: str, id_type: str, incremental: bool = False) -> sql.Composed:
+    """
+    UPDATE of one POI type for all elements whose bbox centre lies in the tile.
+    Distance, density and both size categories come from a single pass: one KNN lookup
+    and one radius aggregate per element. Elements without a POI within the radius are
+    reset to NULL, so reruns never keep stale values. Incremental statements only touch
+    elements near changed POIs or new ids.
+    """
+    source = POI_REGISTRY[poi_type]
+    geom = sql.SQL("t.{}").format(sql.Identifier(target['geom']))
+    poi = sql.Identifier(source.table)
+    metrics = sql.SQL("""
+        CASE WHEN ST_DWithin({geom}, nearest.geom, %(distance)s)
+            THEN ROUND(ST_Distance({geom}, nearest.geom)) END AS poi_distance,
+        CASE WHEN ST_DWithin({geom}, nearest.geom, %(distance)s)
+            THEN {closest_size} END AS poi_size_closest,
+        NULLIF(within.poi_count, 0) AS poi_density,
+        {cumulated_size} AS poi_size_cumulated
+    """).format(
+        geom=geom,
+        closest_size=size_category_sql(source, 'nearest.area'),
+        cumulated_size=size_category_sql(source, 'within.area')
+    )
+    within = sql.SQL("""
+        CROSS JOIN LATERAL (
+            SELECT COUNT(*) AS poi_count, SUM(p.area) AS area
+            FROM {poi} p
+            WHERE ST_DWithin(p.geom, {geom}, %(distance)s)
+        ) within
+    """).format(poi=poi, geom=geom)
+    assignments = sql.SQL("""
+        poi_distance = n.poi_distance,
+        poi_size_closest = n.poi_size_closest,
+        poi_density = n.poi_density,
+        poi_size_cumulated = n.poi_size_cumulated
+    """)
+
+    if incremental:
+        scope = sql.SQL("""
+              AND (
+                  EXISTS (SELECT 1 FROM {changes} c WHERE ST_DWithin(c.geom, {geom}, %(distance)s))
+                  OR EXISTS (SELECT 1 FROM {refresh} r
+                             WHERE r.id = CAST(t.{id} AS {id_type}) AND r.poi_type = %(poi_type)s)
+              )
+        """).format(
+            changes=sql.Identifier(source.table + '_changes'),
+            refresh=sql.Identifier(target['poi_table'] + '_refresh'),
+            geom=geom,
+            id=sql.Identifier(target['id']),
+            id_type=sql.SQL(id_type)
+        )
+    else:
+        scope = sql.SQL("")
+
+    return sql.SQL("""
+        UPDATE {poi_table} h
+        SET {assignments}
+        FROM (
+            SELECT CAST(t.{id} AS {id_type}) AS id, {metrics}
+            FROM {table} t
+            -- LEFT JOIN, so elements are reset to NULL even when there is no POI at all
+            LEFT JOIN LATERAL (
+                SELECT p.geom, p.area
+                FROM {poi} p
+                ORDER BY p.geom <-> {geom}
+                LIMIT 1
+            ) nearest ON true
+            {within}
+            WHERE (ST_XMin({geom}) + ST_XMax({geom})) / 2 >= %(xmin)s
+              AND (ST_XMin({geom}) + ST_XMax({geom})) / 2 < %(xmax)s
+              AND (ST_YMin({geom}) + ST_YMax({geom})) / 2 >= %(ymin)s
+              AND (ST_YMin({geom}) + ST_YMax({geom})) / 2 < %(ymax)s
+              {scope}
+        ) n
+        WHERE h.{poi_id} = n.id AND h.poi_type = %(poi_type)s
+    """).format(
+        poi_table=sql.Identifier(target['poi_table']),
+        assignments=assignments,
+        id=sql.Identifier(target['id']),
+        id_type=sql.SQL(id_type),
+        metrics=metrics,
+        table=sql.Identifier(target['table']),
+        poi=poi,
+        geom=geom,
+        within=within,
+        scope=scope,
+        poi_id=sql.Identifier(target['poi_id'])
+    )
+
+def run_tile(dsn: str, statement: sql.Composed, params: Dict) -> Tuple[int, float]:
+    """Compute one tile on its own connection and commit it"""
+    start_time = time.perf_counter()
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(statement, params)
+            updated = cur.rowcount
+        conn.commit()
+        return updated, time.perf_counter() - start_time
+    finally:
+        conn.close()
+
+def run(dsn: str, targets: List[str], poi_types: Optional[List[str]] = None, distance: Optional[float] = None,
+        workers: int = 4, tiles: int = 16, prepare: bool = True, incremental: bool = False) -> None:
+    """
+    Recompute the POI attributes of the given targets tile by tile on `workers` connections.
+    poi_types defaults to DEFAULT_POI_TYPES (urban is opt-in). Each POI type uses its
+    registered radius unless `distance` overrides it. With incremental=True only elements
+    within the radius of POIs that changed since the previous import (and elements new
+    to the network) are recomputed.
+    """
+    poi_types = poi_types or DEFAULT_POI_TYPES
+
+    conn = psycopg2.connect(dsn)
+    jobs = []
+    try:
+        with conn.cursor() as cur:
+            full_types = prepare_poi_tables(cur, poi_types, incremental) if prepare else []
+            for poi_type in full_types:
+                if incremental:
+                    print(f"No previous {poi_type} import, recomputing it in full")
+            for name in targets:
+                target = TARGETS[name]
+                id_type = column_type(cur, target['poi_table'], target['poi_id'])
+                refresh = sql.Identifier(target['poi_table'] + '_refresh')
+                # Truncated by finish_poi_tables only, so ids seeded by a failed run are still computed
+                cur.execute(sql.SQL("CREATE UNLOGGED TABLE IF NOT EXISTS {} (id {}, poi_type TEXT)").format(
+                    refresh, sql.SQL(id_type)))
+                ensure_metric_columns(cur, target)
+                for poi_type in poi_types:
+                    sync_poi_rows(cur, target, poi_type, id_type)
+                    statement = tile_statement(target, poi_type, id_type,
+                                               incremental and poi_type not in full_types)
+                    for xmin, ymin, xmax, ymax in make_tiles(cur, target, tiles):
+                        jobs.append((f"{name}/{poi_type}", statement, {
+                            'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax,
+                            'distance': distance or POI_REGISTRY[poi_type].radius, 'poi_type': poi_type
+                        }))
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"Running {len(jobs)} tile jobs on {workers} connections...")
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_tile, dsn, statement, params): label
+                   for label, statement, params in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            updated, seconds = future.result()
+            print(f"[{done}/{len(jobs)}] {futures[future]}: updated {updated} rows in {seconds:.1f}s")
+
+    # Only reached when no tile failed, a failed run keeps its changes for the next one
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            finish_poi_tables(cur, poi_types, targets)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"POI preprocessing completed in {time.perf_counter() - start_time:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel POI distance preprocessing")
+    parser.add_argument("--dsn", default=os.environ.get("GO_WANDR_DSN", ""))
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--poi-types", nargs="+", choices=list(POI_REGISTRY), default=DEFAULT_POI_TYPES,
+                        help="POI types to compute (default: all except opt-in types like urban)")
+    parser.add_argument("--distance", type=float, help="Search radius in meters (default: per POI type)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Parallel database connections")
+    parser.add_argument("--tiles", type=int, default=16, help="Approximate number of spatial tiles per target")
+    parser.add_argument("--skip-prepare", action="store_true", help="Reuse the existing poi_* tables")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only recompute elements near POIs that changed since the previous import")
+    parser.add_argument("--snapshot", help="Export the routing snapshot to this file when done")
+    args = parser.parse_args()
+    if args.incremental and args.skip_prepare:
+        parser.error("--incremental needs a fresh POI import, it cannot be combined with --skip-prepare")
+
+    run(args.dsn, args.targets, args.poi_types, args.distance, args.workers, args.tiles,
+        prepare=not args.skip_prepare, incremental=args.incremental)
+
+    if args.snapshot:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            with conn.cursor() as cur:
+                export_snapshot(cur, args.snapshot)
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from typing import NamedTuple, Tuple
+
+# Size categories in ascending order, a POI type's thresholds are the upper bounds of all but the last
+SIZE_CATEGORIES = ('S', 'M', 'L', 'XL')
+
+class POIType(NamedTuple):
+    """
+    One kind of POI the preprocessing computes distance, density and size categories for.
+    osm_filter is a WHERE clause on osm_table; size_thresholds are way_area bounds in m²
+    (empty for point POIs, which then get no size categories). Types with default=False
+    are only computed when requested explicitly.
+    """
+    name: str
+    osm_table: str
+    osm_filter: str
+    radius: float = 5000
+    size_thresholds: Tuple[float, ...] = ()
+    default: bool = True
+
+    @property
+    def table(self) -> str:
+        """Pre-transformed, indexed copy of the POIs in LV95"""
+        return f"poi_{self.name}"
+
+# Adding a type (e.g. viewpoints or huts) only needs an entry here
+POI_REGISTRY = {poi_type.name: poi_type for poi_type in [
+    POIType(
+        name='lake',
+        osm_table='planet_osm_polygon',
+        osm_filter="\"natural\" = 'water' AND water = 'lake'",
+        size_thresholds=(10000, 100000, 1000000)
+    ),
+    # Not the definition the existing stop_has_poi urban rows were computed with (that
+    # preprocessing is not part of this repo), so a default run must not overwrite them
+    POIType(
+        name='urban',
+        osm_table='planet_osm_polygon',
+        osm_filter="landuse IN ('residential', 'commercial', 'industrial', 'retail')",
+        size_thresholds=(10000, 100000, 1000000),
+        default=False
+    ),
+    POIType(
+        name='restaurant_guesthouse',
+        osm_table='planet_osm_point',
+        osm_filter="amenity IN ('restaurant', 'guesthouse')"
+    ),
+]}
+
+# Types a preprocessing run computes when none are given
+DEFAULT_POI_TYPES = [name for name, poi_type in POI_REGISTRY.items() if poi_type.default]
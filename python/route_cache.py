@@ -0,0 +1,234 @@
+"""
+Request-level cache for /hike route results.
+
+Keys combine the snapped start (vertex or stop id), the desired length rounded
+to LENGTH_STEP, mode, weights, preference flags, POI preferences and the data
+version, so equivalent requests share an entry and a new preprocessing run
+never serves stale routes. Every key is computed up to `variants` times and
+keeps the distinct results; until that many computations were stored a lookup
+misses, afterwards one of the stored results is picked at random, so users
+still see varied routes without a new search. A deterministic search simply
+ends up with a single stored result. Results are copied in and out, so callers
+may modify what they get.
+"""
+import copy
+import fcntl
+import hashlib
+import json
+import os
+import random
+import threading
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import count
+
+# Desired lengths within the same step share cache entries (meters)
+LENGTH_STEP = 250
+
+def _canonical(value: Any) -> Any:
+    """JSON-serializable, order-independent form of request parameters"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple, set)):
+        items = [_canonical(v) for v in value]
+        return sorted(items, key=json.dumps) if isinstance(value, set) else items
+    if isinstance(value, float):
+        return round(value, 6)
+    if hasattr(value, 'model_dump'):
+        return _canonical(value.model_dump())
+    if hasattr(value, 'dict'):
+        return _canonical(value.dict())
+    if hasattr(value, '__dict__'):
+        return _canonical(vars(value))
+    return value
+
+def route_cache_key(start: Any,
+                    desired_length: float,
+                    mode: str,
+                    cost_weights: Dict[str, float],
+                    preferences: Dict[str, Any],
+                    poi_preferences: Any,
+                    data_version: str,
+                    length_step: float = LENGTH_STEP) -> str:
+    """
+    Cache key for a route request. start is the snapped start vertex or stop id,
+    preferences holds flags like elevation type, prefer_hard_surface and trail type.
+    """
+    payload = {
+        'start': _canonical(start),
+        'length': int(round(desired_length / length_step)),
+        'mode': mode,
+        'weights': _canonical(cost_weights),
+        'preferences': _canonical(preferences),
+        'poi_preferences': _canonical(poi_preferences),
+        'data_version': data_version
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def _with_result(entry: Optional[Dict], result: Any, max_attempts: int) -> Optional[Dict]:
+    """
+    Entry {'attempts', 'variants'} after storing one more computed result, None if the key
+    already had all its attempts. A result equal to a stored variant only counts as an attempt.
+    """
+    entry = entry or {'attempts': 0, 'variants': []}
+    if entry['attempts'] >= max_attempts:
+        return None
+    variants = list(entry['variants'])
+    if result not in variants:
+        variants.append(result)
+    return {'attempts': entry['attempts'] + 1, 'variants': variants}
+
+class DiskBackend:
+    """
+    Shared store for several workers: one JSON file per key in a directory.
+    Updates are read-merge-write under an exclusive file lock, and at most
+    max_entries keys are kept, the least recently used (by file mtime) are evicted.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, '.lock')
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Files of the earlier plain-list format are treated as missing
+        return entry if isinstance(entry, dict) else None
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._read(key)
+        if entry is not None:
+            # The mtime is the LRU order on disk
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+        return entry
+
+    def add(self, key: str, result: Any, max_attempts: int) -> Dict:
+        """Merge result into the stored entry of key and return the entry, safe across processes"""
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                stored = self._read(key)
+                entry = _with_result(stored, result, max_attempts)
+                if entry is None:
+                    return stored
+                # Write and rename, so concurrent readers never see a partial file
+                tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(entry, f)
+                os.replace(tmp_path, self._path(key))
+                if stored is None:
+                    self._evict()
+                return entry
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _evict(self) -> None:
+        """Drop the least recently used keys beyond max_entries (caller holds the file lock)"""
+        paths = [entry.path for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+        if len(paths) <= self.max_entries:
+            return
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+        for path in sorted(mtimes, key=mtimes.get)[:len(mtimes) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+class RouteCache:
+    """Size-bounded LRU of route results with an optional shared backend"""
+
+    def __init__(self, max_entries: int = 1024, variants: int = 3, backend: Optional[DiskBackend] = None,
+                 seed: Optional[int] = None):
+        self.max_entries = max_entries
+        self.variants = variants
+        self.backend = backend
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _stored(self, key: str) -> Optional[Dict]:
+        """Entry for key from memory, falling back to the backend (caller holds the lock)"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        entry = self.backend.get(key) if self.backend is not None else None
+        if entry:
+            self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: Dict) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """A copy of a random stored variant once the key was computed `variants` times, None otherwise"""
+        with self._lock:
+            entry = self._stored(key)
+            if entry is not None and entry['attempts'] < self.variants and self.backend is not None:
+                # Other workers may have stored attempts since this copy was read
+                entry = self.backend.get(key) or entry
+                self._remember(key, entry)
+            if entry is None or entry['attempts'] < self.variants:
+                count('route_cache_misses')
+                return None
+            count('route_cache_hits')
+            return copy.deepcopy(self._random.choice(entry['variants']))
+
+    def put(self, key: str, result: Any) -> None:
+        """Store a freshly computed result as another attempt of key"""
+        result = copy.deepcopy(result)
+        with self._lock:
+            if self.backend is not None:
+                # Merge with what other workers stored meanwhile instead of overwriting it
+                entry = self.backend.add(key, result, self.variants)
+            else:
+                entry = _with_result(self._stored(key), result, self.variants)
+                if entry is None:
+                    return
+            self._remember(key, entry)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Serve a cached variant or run compute() and store its result"""
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+def _default_backend(max_entries: int) -> Optional[DiskBackend]:
+    directory = os.environ.get("ROUTE_CACHE_DIR")
+    return DiskBackend(directory, max_entries) if directory else None
+
+# Shared cache; set ROUTE_CACHE_DIR to share results between workers
+_max_entries = int(os.environ.get("ROUTE_CACHE_SIZE", 1024))
+route_cache = RouteCache(
+    max_entries=_max_entries,
+    variants=int(os.environ.get("ROUTE_CACHE_VARIANTS", 3)),
+    backend=_default_backend(_max_entries)
+)
@@ -0,0 +1,94 @@
+from typing import Dict, Iterable, List, Optional
+import networkx as nx
+import numpy as np
+
+# Category codes shared by the graph arrays and GeoJSON features
+SURFACE_HARD = 0
+SURFACE_NATURAL = 1
+SURFACE_OTHER = 2
+SURFACE_CODES = {'Hart': SURFACE_HARD, 'Natur': SURFACE_NATURAL}
+
+TRAIL_HIKING = 0
+TRAIL_MOUNTAIN = 1
+TRAIL_ALPINE = 2
+TRAIL_STREET = 3  # everything that is not a signposted hiking trail
+TRAIL_CODES = {'Wanderweg': TRAIL_HIKING, 'Bergwanderweg': TRAIL_MOUNTAIN, 'Alpinwanderweg': TRAIL_ALPINE}
+
+class EdgeArrays:
+    """Per-edge attributes of a graph as NumPy arrays, addressed by a dense edge index"""
+
+    def __init__(self, length: np.ndarray, elevation_diff: np.ndarray, duration: np.ndarray,
+                 surface: np.ndarray, trail: np.ndarray, edge_index: Optional[Dict] = None):
+        self.length = length
+        self.elevation_diff = elevation_diff
+        self.duration = duration
+        self.surface = surface
+        self.trail = trail
+        self.edge_index = edge_index or {}
+
+    @classmethod
+    def from_graph(cls, G: nx.DiGraph) -> 'EdgeArrays':
+        edges = list(G.edges(data=True))
+        return cls(
+            length=np.array([d.get('length') or 0.0 for _, _, d in edges], dtype=float),
+            elevation_diff=np.array([d.get('elevation_diff') or 0.0 for _, _, d in edges], dtype=float),
+            duration=np.array([np.nan if d.get('duration') is None else d['duration'] for _, _, d in edges],
+                              dtype=float),
+            surface=_surface_codes(d.get('surface') for _, _, d in edges),
+            trail=_trail_codes(d.get('trail_type') for _, _, d in edges),
+            edge_index={(u, v): i for i, (u, v, _) in enumerate(edges)}
+        )
+
+    @classmethod
+    def from_features(cls, features: List[Dict]) -> 'EdgeArrays':
+        """Arrays for the edges of a route returned as GeoJSON features (in path order)"""
+        properties = [feature['properties'] for feature in features]
+        return cls(
+            length=np.array([p.get('length') or 0.0 for p in properties], dtype=float),
+            elevation_diff=np.array([p.get('elevation_diff') or 0.0 for p in properties], dtype=float),
+            duration=np.array([np.nan if p.get('duration') is None else p['duration'] for p in properties],
+                              dtype=float),
+            surface=_surface_codes(p.get('belagsart') for p in properties),
+            trail=_trail_codes(p.get('trail_type') for p in properties)
+        )
+
+    def path_edges(self, path: List[int]) -> np.ndarray:
+        """Edge indices along a vertex path"""
+        return np.fromiter((self.edge_index[(u, v)] for u, v in zip(path[:-1], path[1:])),
+                           dtype=np.int64, count=max(len(path) - 1, 0))
+
+def _surface_codes(values: Iterable) -> np.ndarray:
+    return np.array([SURFACE_CODES.get(value, SURFACE_OTHER) for value in values], dtype=np.int8)
+
+def _trail_codes(values: Iterable) -> np.ndarray:
+    return np.array([TRAIL_CODES.get(value, TRAIL_STREET) for value in values], dtype=np.int8)
+
+def _share(length: np.ndarray, mask: np.ndarray, total: float) -> float:
+    return round(float(length[mask].sum() / total * 100), 2) if total > 0 else 0
+
+def route_statistics(edges: EdgeArrays, edge_indices: Optional[np.ndarray] = None) -> Dict:
+    """
+    All per-route aggregates from gathers and reductions on the edge arrays.
+    Without edge_indices every edge of `edges` is taken as the route.
+    """
+    if edge_indices is None:
+        edge_indices = slice(None)
+    length = edges.length[edge_indices]
+    elevation_diff = edges.elevation_diff[edge_indices]
+    surface = edges.surface[edge_indices]
+    trail = edges.trail[edge_indices]
+    total_distance = float(length.sum())
+
+    hard_surface_percentage = _share(length, surface == SURFACE_HARD, total_distance)
+    return {
+        'total_distance': round(total_distance, 2),
+        'total_elevation_gain': round(float(elevation_diff[elevation_diff > 0].sum()), 2),
+        'total_elevation_loss': round(abs(float(elevation_diff[elevation_diff < 0].sum())), 2),
+        'net_elevation_difference': round(float(elevation_diff.sum()), 2),
+        'tobler_duration': round(float(np.nansum(edges.duration[edge_indices])), 2),
+        'hard_surface_percentage': hard_surface_percentage,
+        'natural_surface_percentage': round(100 - hard_surface_percentage, 2),
+        'hiking_percentage': _share(length, trail == TRAIL_HIKING, total_distance),
+        'trail_percentage': _share(length, trail == TRAIL_MOUNTAIN, total_distance),
+        'street_percentage': _share(length, trail >= TRAIL_ALPINE, total_distance)
+    }
@@ -0,0 +1,59 @@
+import random
+from typing import Dict, List, Optional
+
+class RouteTrace:
+    """
+    Per-request collector for the edge-level cost breakdown of a routing search.
+    Nothing is traced unless a request creates a RouteTrace (e.g. for debug=True).
+    sample_rate controls which share of relaxed edges is recorded during the
+    search; the breakdown of the winning path is always recorded in full.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, max_sampled_edges: int = 10000, seed: Optional[int] = None):
+        self.sample_rate = sample_rate
+        self.max_sampled_edges = max_sampled_edges
+        self.sampled_edges: List[Dict] = []
+        self.path_edges: List[Dict] = []
+        self._random = random.Random(seed)
+
+    @property
+    def sampling(self) -> bool:
+        """Whether edges relaxed during the search should be offered to sample()"""
+        return self.sample_rate > 0
+
+    def sample(self) -> bool:
+        """Decide whether the current edge relaxation is recorded"""
+        return (len(self.sampled_edges) < self.max_sampled_edges
+                and self._random.random() < self.sample_rate)
+
+    def record_edge(self, search: str, u: int, v: int, d: Dict, elevation_cost: float,
+                    surface_cost: float, trail_cost: float, weighted_cost: float) -> None:
+        self.sampled_edges.append(edge_breakdown(search, u, v, d, elevation_cost,
+                                                 surface_cost, trail_cost, weighted_cost))
+
+    def record_path(self, path_edges: List[Dict]) -> None:
+        self.path_edges = path_edges
+
+    def to_dict(self) -> Dict:
+        """Export the trace, e.g. to attach it to a debug response"""
+        return {
+            'sample_rate': self.sample_rate,
+            'sampled_edges': self.sampled_edges,
+            'path_edges': self.path_edges
+        }
+
+def edge_breakdown(search: str, u: int, v: int, d: Dict, elevation_cost: float,
+                   surface_cost: float, trail_cost: float, weighted_cost: float) -> Dict:
+    """Structured cost breakdown of a single edge"""
+    return {
+        'search': search,
+        'source': u,
+        'target': v,
+        'elevation_diff': d.get('elevation_diff', 0),
+        'surface': d.get('surface'),
+        'trail_type': d.get('trail_type'),
+        'elevation_cost': elevation_cost,
+        'surface_cost': surface_cost,
+        'trail_cost': trail_cost,
+        'weighted_cost': weighted_cost
+    }
@@ -0,0 +1,221 @@
+"""
+Binary routing snapshot written as the last preprocessing stage.
+
+One .npz file holds everything the API otherwise scans from the database at
+startup: hiking edge topology and cost attributes, edge geometries, vertex
+coordinates, vertex/edge POI distances, stop_has_poi and the stop -> vertex
+snapping. Workers load it with GraphManager(snapshot_file=...) and
+load_snapshot_indexes() instead of querying wanderwege_edges_3.
+
+    python routing_snapshot.py --dsn "dbname=gowandr" --output routing_snapshot.npz
+"""
+import argparse
+import math
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import psycopg2
+
+from poi_registry import POI_REGISTRY
+from stop_poi_index import stop_poi_index
+from vertex_poi_index import vertex_poi_index, POI_TYPES as VERTEX_POI_TYPES
+
+SNAPSHOT_VERSION = 1
+
+def _text(values: List[Optional[str]]) -> np.ndarray:
+    """Strings as a fixed-width unicode array, None is stored as ''"""
+    return np.array(['' if value is None else str(value) for value in values], dtype=str)
+
+def _untext(values: np.ndarray) -> List[Optional[str]]:
+    return [str(value) or None for value in values]
+
+def _floats(values: List[Optional[float]]) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+def _aligned(ids: np.ndarray, rows: List[Tuple]) -> np.ndarray:
+    """Scatter (id, value) rows into a float array aligned with the sorted ids, NaN where missing"""
+    values = np.full(len(ids), np.nan)
+    if rows and len(ids):
+        row_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        positions = np.clip(np.searchsorted(ids, row_ids), 0, len(ids) - 1)
+        known = ids[positions] == row_ids
+        values[positions[known]] = _floats([row[1] for row in rows])[known]
+    return values
+
+def export_snapshot(cur, path: str, edges_table: str = 'wanderwege_edges_3',
+                    vertices_table: str = 'wanderwege_vertices_3') -> None:
+    """Write the routing snapshot for the hiking network to path"""
+    arrays: Dict[str, np.ndarray] = {
+        'version': np.array(SNAPSHOT_VERSION),
+        'data_version': np.array(datetime.now().isoformat(timespec='seconds'))
+    }
+
+    print("Exporting edges...")
+    cur.execute(f"""
+        SELECT id, source, target, length, elevation_difference,
+               belagsart, wanderwege, tobler_duration, geom
+        FROM {edges_table}
+        ORDER BY id
+    """)
+    edges = cur.fetchall()
+    arrays['edge_id'] = np.array([edge[0] for edge in edges], dtype=np.int64)
+    arrays['edge_source'] = np.array([edge[1] for edge in edges], dtype=np.int64)
+    arrays['edge_target'] = np.array([edge[2] for edge in edges], dtype=np.int64)
+    arrays['edge_length'] = _floats([edge[3] for edge in edges])
+    arrays['edge_elevation_diff'] = _floats([edge[4] for edge in edges])
+    arrays['edge_surface'] = _text([edge[5] for edge in edges])
+    arrays['edge_trail_type'] = _text([edge[6] for edge in edges])
+    arrays['edge_duration'] = _floats([edge[7] for edge in edges])
+    # Geometries stay hex EWKB as returned by psycopg2, concatenated with offsets
+    geoms = [(edge[8] or '').encode('ascii') for edge in edges]
+    arrays['edge_geom'] = np.frombuffer(b''.join(geoms), dtype=np.uint8)
+    arrays['edge_geom_offsets'] = np.cumsum([0] + [len(geom) for geom in geoms], dtype=np.int64)
+
+    for poi_type in POI_REGISTRY:
+        cur.execute("SELECT edge_id, poi_distance FROM edge_has_poi WHERE poi_type = %s", (poi_type,))
+        arrays[f'edge_poi_{poi_type}'] = _aligned(arrays['edge_id'], cur.fetchall())
+
+    print("Exporting vertices...")
+    cur.execute(f"""
+        SELECT vertex_id, ST_X(vertex), ST_Y(vertex)
+        FROM {vertices_table}
+        ORDER BY vertex_id
+    """)
+    vertices = cur.fetchall()
+    arrays['vertex_id'] = np.array([vertex[0] for vertex in vertices], dtype=np.int64)
+    arrays['vertex_x'] = _floats([vertex[1] for vertex in vertices])
+    arrays['vertex_y'] = _floats([vertex[2] for vertex in vertices])
+    for poi_type in POI_REGISTRY:
+        cur.execute("SELECT vertex_id, poi_distance FROM vertex_has_poi WHERE poi_type = %s", (poi_type,))
+        arrays[f'vertex_poi_{poi_type}'] = _aligned(arrays['vertex_id'], cur.fetchall())
+
+    print("Exporting stops...")
+    cur.execute(f"""
+        SELECT s.xtf_id, ST_X(s.geom), ST_Y(s.geom), v.vertex_id
+        FROM stops s
+        CROSS JOIN LATERAL (
+            SELECT vertex_id
+            FROM {vertices_table}
+            ORDER BY vertex <-> s.geom
+            LIMIT 1
+        ) v
+        ORDER BY s.xtf_id
+    """)
+    stops = cur.fetchall()
+    arrays['stop_id'] = _text([stop[0] for stop in stops])
+    arrays['stop_x'] = _floats([stop[1] for stop in stops])
+    arrays['stop_y'] = _floats([stop[2] for stop in stops])
+    arrays['stop_vertex'] = np.array([stop[3] for stop in stops], dtype=np.int64)
+
+    cur.execute("""
+        SELECT stop_id, poi_type, poi_distance, poi_density, poi_size_closest, poi_size_cumulated
+        FROM stop_has_poi
+    """)
+    stop_pois = cur.fetchall()
+    arrays['stop_poi_stop_id'] = _text([row[0] for row in stop_pois])
+    arrays['stop_poi_type'] = _text([row[1] for row in stop_pois])
+    arrays['stop_poi_distance'] = _floats([row[2] for row in stop_pois])
+    arrays['stop_poi_density'] = _floats([row[3] for row in stop_pois])
+    arrays['stop_poi_size_closest'] = _text([row[4] for row in stop_pois])
+    arrays['stop_poi_size_cumulated'] = _text([row[5] for row in stop_pois])
+
+    # Write next to the target and rename, so running workers never see a partial file
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    print(f"Saved routing snapshot ({len(edges)} edges, {len(vertices)} vertices, "
+          f"{len(stops)} stops) to {path}")
+
+class RoutingSnapshot:
+    """Read access to a routing snapshot in the shapes the graph and indexes are built from"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        version = int(arrays['version'])
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported routing snapshot version {version}, expected {SNAPSHOT_VERSION}")
+        self.arrays = arrays
+
+    @property
+    def data_version(self) -> str:
+        """Export timestamp, identifies the preprocessing run the data comes from"""
+        return str(self.arrays['data_version'])
+
+    def edge_rows(self) -> Iterator[Tuple]:
+        """Edges as (id, source, target, length, elevation_difference, belagsart, wanderwege, tobler_duration, geom)"""
+        a = self.arrays
+        geom = a['edge_geom'].tobytes()
+        offsets = a['edge_geom_offsets'].tolist()
+        # Plain Python lists, element-wise NumPy indexing is slow for a million edges
+        for i, row in enumerate(zip(
+            a['edge_id'].tolist(), a['edge_source'].tolist(), a['edge_target'].tolist(),
+            a['edge_length'].tolist(), a['edge_elevation_diff'].tolist(),
+            _untext(a['edge_surface']), _untext(a['edge_trail_type']), a['edge_duration'].tolist()
+        )):
+            edge_id, source, target, length, elevation_diff, surface, trail_type, duration = row
+            yield (
+                edge_id, source, target, length,
+                None if math.isnan(elevation_diff) else elevation_diff,
+                surface, trail_type,
+                None if math.isnan(duration) else duration,
+                geom[offsets[i]:offsets[i + 1]].decode('ascii') or None
+            )
+
+    def vertex_arrays(self, poi_types: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """Sorted vertex ids, LV95 coordinates and POI distances (NaN where none)"""
+        a = self.arrays
+        return a['vertex_id'], a['vertex_x'], a['vertex_y'], {
+            poi_type: a[f'vertex_poi_{poi_type}'] for poi_type in poi_types
+        }
+
+    def edge_poi_distance(self, poi_type: str) -> Dict[int, float]:
+        """edge_id -> POI distance for edges with a POI of that type in range"""
+        distance = self.arrays[f'edge_poi_{poi_type}']
+        known = ~np.isnan(distance)
+        return dict(zip(self.arrays['edge_id'][known].tolist(), distance[known].tolist()))
+
+    def stop_vertices(self) -> Dict[str, int]:
+        """stop id -> nearest hiking network vertex"""
+        return dict(zip(self.arrays['stop_id'].tolist(), self.arrays['stop_vertex'].tolist()))
+
+    def stop_poi_rows(self) -> List[Tuple]:
+        """stop_has_poi rows as (stop_id, poi_type, distance, density, size_closest, size_cumulated)"""
+        a = self.arrays
+        return [
+            (stop_id, poi_type,
+             None if np.isnan(distance) else distance,
+             None if np.isnan(density) else density,
+             size_closest or None, size_cumulated or None)
+            for stop_id, poi_type, distance, density, size_closest, size_cumulated in zip(
+                a['stop_poi_stop_id'].tolist(), a['stop_poi_type'].tolist(),
+                a['stop_poi_distance'].tolist(), a['stop_poi_density'].tolist(),
+                a['stop_poi_size_closest'].tolist(), a['stop_poi_size_cumulated'].tolist()
+            )
+        ]
+
+def load_snapshot(path: str) -> RoutingSnapshot:
+    """Read a routing snapshot written by export_snapshot"""
+    with np.load(path, allow_pickle=False) as data:
+        return RoutingSnapshot({name: data[name] for name in data.files})
+
+def load_snapshot_indexes(snapshot: RoutingSnapshot) -> None:
+    """Fill the shared stop and vertex POI indexes from a snapshot instead of the database"""
+    stop_poi_index.load_rows(snapshot.stop_poi_rows())
+    vertex_poi_index.load_arrays(*snapshot.vertex_arrays(VERTEX_POI_TYPES))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the binary routing snapshot")
+    parser.add_argument("--dsn", default=os.environ.get("GO_WANDR_DSN", ""))
+    parser.add_argument("--output", default="routing_snapshot.npz")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        with conn.cursor() as cur:
+            export_snapshot(cur, args.output)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from typing import Dict, List
+import numpy as np
+from poi_registry import POI_REGISTRY, SIZE_CATEGORIES
+
+POI_TYPES = list(POI_REGISTRY)
+SIZE_CODES = {category: code for code, category in enumerate(SIZE_CATEGORIES)}
+
+class StopPOIIndex:
+    """
+    Columnar in-memory copy of stop_has_poi.
+    One row per stop, one set of attribute arrays per poi_type, so POI filtering
+    is a handful of vectorized boolean masks instead of a database round trip.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.row_of: Dict[str, int] = {}
+        self.has_poi: Dict[str, np.ndarray] = {}
+        self.distance: Dict[str, np.ndarray] = {}
+        self.density: Dict[str, np.ndarray] = {}
+        self.size_closest: Dict[str, np.ndarray] = {}
+        self.size_cumulated: Dict[str, np.ndarray] = {}
+
+    def load(self, cur) -> None:
+        """Load stop_has_poi into memory (call once at startup)"""
+        if self.loaded:
+            return
+
+        print("Loading stop POI index...")
+        cur.execute("""
+            SELECT stop_id, poi_type, poi_distance, poi_density, poi_size_closest, poi_size_cumulated
+            FROM stop_has_poi
+            WHERE poi_type = ANY(%s)
+        """, (POI_TYPES,))
+        self.load_rows(cur.fetchall())
+
+    def load_rows(self, rows: List) -> None:
+        """Build the arrays from stop_has_poi rows (from the database or a routing snapshot)"""
+        rows = [row for row in rows if row[1] in POI_TYPES]
+
+        # Stop ids are compared as strings, the procedures store them as integer or varchar
+        self.row_of = {}
+        for row in rows:
+            self.row_of.setdefault(str(row[0]), len(self.row_of))
+        num_stops = len(self.row_of)
+
+        for poi_type in POI_TYPES:
+            self.has_poi[poi_type] = np.zeros(num_stops, dtype=bool)
+            self.distance[poi_type] = np.full(num_stops, np.nan)
+            self.density[poi_type] = np.full(num_stops, np.nan)
+            self.size_closest[poi_type] = np.full(num_stops, -1, dtype=np.int8)
+            self.size_cumulated[poi_type] = np.full(num_stops, -1, dtype=np.int8)
+
+        for stop_id, poi_type, distance, density, size_closest, size_cumulated in rows:
+            i = self.row_of[str(stop_id)]
+            self.has_poi[poi_type][i] = True
+            if distance is not None:
+                self.distance[poi_type][i] = distance
+            if density is not None:
+                self.density[poi_type][i] = density
+            self.size_closest[poi_type][i] = SIZE_CODES.get(size_closest, -1)
+            self.size_cumulated[poi_type][i] = SIZE_CODES.get(size_cumulated, -1)
+
+        self.loaded = True
+        print(f"Loaded POI attributes for {num_stops} stops")
+
+    def filter(self, stations: List, poi_preferences) -> List:
+        """Return the stations matching all enabled POI preferences"""
+        if not stations:
+            return stations
+
+        rows = np.array([self.row_of.get(str(station[0]), -1) for station in stations])
+        mask = rows >= 0
+        rows = np.where(mask, rows, 0)
+
+        # NaN comparisons are False, so stops without a POI row drop out like in SQL
+        with np.errstate(invalid='ignore'):
+            if poi_preferences.lake:
+                lake_sizes = [SIZE_CODES[size.value] for size in poi_preferences.lake_sizes or []]
+                mask &= self.distance['lake'][rows] <= poi_preferences.lake_distance
+                mask &= np.isin(self.size_closest['lake'][rows], lake_sizes)
+
+            if poi_preferences.avoid_urban:
+                distance = self.distance['urban'][rows]
+                mask &= self.has_poi['urban'][rows] & (
+                    np.isin(self.size_cumulated['urban'][rows], [SIZE_CODES['S'], SIZE_CODES['M'], SIZE_CODES['L']])
+                    | np.isnan(distance)
+                    | (distance > poi_preferences.urban_distance)
+                )
+
+            if poi_preferences.restaurant:
+                mask &= self.distance['restaurant_guesthouse'][rows] <= poi_preferences.restaurant_distance
+                mask &= self.density['restaurant_guesthouse'][rows] >= poi_preferences.min_restaurant_density
+
+        return [station for station, keep in zip(stations, mask) if keep]
+
+# Shared index, loaded once at startup alongside the graphs
+stop_poi_index = StopPOIIndex()
@@ -2,14 +2,15 @@ from typing import Dict, List, Tuple, Optional
 import networkx as nx
 import numpy as np
 from graph_manager import GraphManager
+from db_pool import pooled_cursor
 import pickle
 
 class StreetGraphManager(GraphManager):
     def __init__(self):
         super().__init__(cache_file='street_graph.pickle')
         
-    def build_graph(self, cur) -> None:
-        """Build graph from street network database edges and cache it"""
+    def build_graph(self, cur=None) -> None:
+        """Build graph from street network database edges and cache it (uses a pooled cursor if none is given)"""
         if self.graph_built:
             return
             
@@ -32,6 +33,10 @@ class StreetGraphManager(GraphManager):
             except Exception as e:
                 print(f"Error loading street graph cache: {e}")
         
+        if cur is None:
+            with pooled_cursor() as cur:
+                return self.build_graph(cur)
+
         print("Building street graph from database...")
         # Get all edges with their attributes
         cur.execute("""
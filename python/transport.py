@@ -2,29 +2,22 @@ import requests
 import json
 from psycopg2 import sql
 import time
-from typing import Tuple, List
+from typing import Tuple, List, Optional
+import warnings
 import random
 from poi import find_poi
 from models import POIPreferences
+from db_pool import execute_prepared
+from metrics import count, timed
 
+@timed('nearest_stations')
 def find_nearest_oev_stations(cur, user_lat, user_lon, radius_km=10):
-    cur.execute("""
-        SELECT xtf_id, name
-        FROM stops
-        WHERE ST_DWithin(
-            geom,
-            ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), 4326), 2056),
-            %s
-        )
-        ORDER BY ST_Distance(
-            geom,
-            ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), 4326), 2056)
-        );
-    """, (user_lon, user_lat, radius_km * 1000, user_lon, user_lat))
-    
+    execute_prepared(cur, 'nearest_stations', (user_lon, user_lat, radius_km * 1000))
+
     return cur.fetchall()
 
 
+@timed('isochrone')
 def find_isochrone(cur, user_lat, user_lon, cutoff=60, is_sunday=False):
     """Entry point function for finding isochrones"""
     print(f"Finding isochrone for {user_lat}, {user_lon} with cutoff {cutoff} minutes...")
@@ -39,28 +32,18 @@ def get_isochrone(cur, user_lat, user_lon, cutoff=60, is_sunday=False):
     # Create unique key for this request
     unique_key = f"{user_lat}_{user_lon}_{cutoff}_{is_sunday}"
     
-    # Check cache first with corrected distance check
-    cur.execute("""
-        SELECT multipolygon 
-        FROM isochrone_cache 
-        WHERE ST_DWithin(
-            ST_Transform(start_coordinates, 2056),
-            ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), 4326), 2056),
-            200  -- 200 meters in Swiss coordinate system (CH1903+/LV95)
-        )
-        AND cutoff = %s
-        AND is_sunday = %s
-        ORDER BY created_at DESC
-        LIMIT 1;
-    """, (user_lon, user_lat, cutoff, is_sunday))
+    # Check cache first (200 meters in Swiss coordinate system (CH1903+/LV95))
+    execute_prepared(cur, 'isochrone_cache_lookup', (user_lon, user_lat, cutoff, is_sunday))
     
     cached_result = cur.fetchone()
     
     if cached_result:
         print("Found cached isochrone!")
+        count('isochrone_cache_hits')
         multipolygon_geom = cached_result[0]
     else:
         print("No cached isochrone found, fetching from API...")
+        count('isochrone_cache_misses')
         multipolygon_geojson = fetch_isochrone(user_lat, user_lon, cutoff, is_sunday)
         
         # Convert GeoJSON to PostGIS geometry with SRID
@@ -150,24 +133,26 @@ def fetch_isochrone(user_lat, user_lon, cutoff, is_sunday=False):
 
     raise ValueError("Failed to get valid response from isochrone API after all retries")
 
+SAVE_ISOCHRONE_QUERY = """
+    INSERT INTO isochrone_cache
+    (start_coordinates, multipolygon, cutoff, is_sunday, unique_key)
+    VALUES (
+        ST_SetSRID(ST_MakePoint(%s, %s), 4326),
+        ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326),
+        %s,
+        %s,
+        %s
+    )
+    ON CONFLICT (unique_key) DO NOTHING;
+"""
+
 def save_isochrone(cur, user_lat, user_lon, multipolygon_geojson, cutoff, is_sunday, unique_key):
-    """Save isochrone to cache"""
+    """Save isochrone to cache and commit it on the caller's connection"""
     print(f"Saving isochrone to cache for {user_lat}, {user_lon} with cutoff {cutoff} minutes...")
-    
-    cur.execute("""
-        INSERT INTO isochrone_cache 
-        (start_coordinates, multipolygon, cutoff, is_sunday, unique_key)
-        VALUES (
-            ST_SetSRID(ST_MakePoint(%s, %s), 4326),
-            ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326),
-            %s,
-            %s,
-            %s
-        )
-        ON CONFLICT (unique_key) DO NOTHING;
-    """, (user_lon, user_lat, multipolygon_geojson, cutoff, is_sunday, unique_key))
-    
-    # Get connection from cursor and commit
+
+    # Committed right away, so the OTP result stays cached even if the request fails later.
+    # No second pooled connection: with every slot held by a request that would deadlock.
+    cur.execute(SAVE_ISOCHRONE_QUERY, (user_lon, user_lat, multipolygon_geojson, cutoff, is_sunday, unique_key))
     cur.connection.commit()
 
 def get_isochrone_geojson(cur, user_lat, user_lon, cutoff=60, is_sunday=False):
@@ -180,20 +165,8 @@ def get_isochrone_geojson(cur, user_lat, user_lon, cutoff=60, is_sunday=False):
     # Create unique key for this request
     unique_key = f"{user_lat}_{user_lon}_{cutoff}_{is_sunday}"
     
-    # Check cache first with corrected distance check
-    cur.execute("""
-        SELECT ST_AsGeoJSON(multipolygon)
-        FROM isochrone_cache 
-        WHERE ST_DWithin(
-            ST_Transform(start_coordinates, 2056),
-            ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), 4326), 2056),
-            200  -- 200 meters in Swiss coordinate system (CH1903+/LV95)
-        )
-        AND cutoff = %s
-        AND is_sunday = %s
-        ORDER BY created_at DESC
-        LIMIT 1;
-    """, (user_lon, user_lat, cutoff, is_sunday))
+    # Check cache first (200 meters in Swiss coordinate system (CH1903+/LV95))
+    execute_prepared(cur, 'isochrone_cache_geojson', (user_lon, user_lat, cutoff, is_sunday))
     
     cached_result = cur.fetchone()
     
@@ -209,6 +182,7 @@ def get_isochrone_geojson(cur, user_lat, user_lon, cutoff=60, is_sunday=False):
         
         return json.loads(multipolygon_geojson)
 
+@timed('station_selection')
 def find_start_stop(
     cur,
     start_coords: List[float],
@@ -249,7 +223,7 @@ def find_start_stop(
 
     # Apply POI preferences if provided
     if poi_preferences:
-        start_stations = find_poi(start_stations, poi_preferences)
+        start_stations = find_poi(start_stations, poi_preferences, cur)
         print(f"Found {len(start_stations)} start stations with POI preferences.")
         print("\n")  # Visual separation
 
@@ -262,52 +236,30 @@ def find_start_stop(
 
     return start_fid, start_name
 
+@timed('end_stop')
 def find_end_stop(
     cur,
     end_coords: List[float],  # [lon, lat]
     is_sunday: bool = False,
-    initial_radius: int = 1000,
+    initial_radius: Optional[int] = None,
     max_radius: int = 5000,
-    radius_increment: int = 500
+    radius_increment: Optional[int] = None
 ) -> Tuple[str, str, float, float, float]:  # Returns (fid, name, type, lon, lat)
     """
-    Find the nearest public transport stop to the end point.
-    Gradually increases search radius until a stop is found.
+    Find the nearest public transport stop within max_radius of the end point
+    with a single index-assisted nearest-neighbour lookup.
+    initial_radius and radius_increment are deprecated and have no effect.
     """
-    current_radius = initial_radius
-    
-    while current_radius <= max_radius:
-        print(f"Searching for end station within {current_radius}m...")
-        
-        # Query for stations within current radius
-        cur.execute("""
-            SELECT 
-                xtf_id, 
-                name, 
-                verkehrsmittel_bezeichnung,
-                ST_X(ST_Transform(geom, 4326)) as lon,
-                ST_Y(ST_Transform(geom, 4326)) as lat,
-                ST_Distance(
-                    geom,
-                    ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), 4326), 2056)
-                ) as distance
-            FROM stops 
-            WHERE ST_DWithin(
-                geom,
-                ST_Transform(ST_SetSRID(ST_MakePoint(%s, %s), 4326), 2056),
-                %s
-            )
-            ORDER BY distance ASC
-            LIMIT 1;
-        """, (end_coords[0], end_coords[1], end_coords[0], end_coords[1], current_radius))
-        
-        result = cur.fetchone()
-        
-        if result:
-            print(f"Found end station: {result[1]} at distance {result[5]:.2f}m")
-            return result
-            
-        print(f"No stations found within {current_radius}m, increasing radius...")
-        current_radius += radius_increment
-    
+    if initial_radius is not None or radius_increment is not None:
+        warnings.warn("find_end_stop: initial_radius and radius_increment are deprecated and ignored",
+                      DeprecationWarning, stacklevel=2)
+    print(f"Searching for end station within {max_radius}m...")
+    execute_prepared(cur, 'nearest_end_stop', (end_coords[0], end_coords[1]))
+
+    result = cur.fetchone()
+
+    if result and result[5] <= max_radius:
+        print(f"Found end station: {result[1]} at distance {result[5]:.2f}m")
+        return result
+
     raise ValueError(f"No public transport stops found within {max_radius}m of end point")
\ No newline at end of file
@@ -0,0 +1,114 @@
+from typing import Dict, Iterator, Optional, Tuple
+import numpy as np
+
+POI_TYPES = ['lake', 'restaurant_guesthouse']
+
+class VertexPOIIndex:
+    """
+    In-memory copy of the hiking network vertices with their POI distances.
+    Rows are sorted by vertex_id, so a vertex id maps to its row via searchsorted
+    and all per-vertex arrays (coordinates, POI distances) share that order.
+    """
+
+    def __init__(self, vertices_table='wanderwege_vertices_3'):
+        self.vertices_table = vertices_table
+        self.loaded = False
+        self.vertex_ids = np.empty(0, dtype=np.int64)
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.poi_distance = {}
+
+    def load(self, cur) -> None:
+        """Load vertex coordinates (LV95) and POI distances (call once at startup)"""
+        if self.loaded:
+            return
+
+        print("Loading vertex POI index...")
+        cur.execute(f"""
+            SELECT
+                v.vertex_id,
+                ST_X(v.vertex),
+                ST_Y(v.vertex),
+                lake.poi_distance,
+                restaurant.poi_distance
+            FROM {self.vertices_table} v
+            LEFT JOIN vertex_has_poi lake
+                ON lake.vertex_id = v.vertex_id AND lake.poi_type = 'lake'
+            LEFT JOIN vertex_has_poi restaurant
+                ON restaurant.vertex_id = v.vertex_id AND restaurant.poi_type = 'restaurant_guesthouse'
+            ORDER BY v.vertex_id
+        """)
+        rows = np.array(cur.fetchall(), dtype=float).reshape(-1, 5)
+
+        # Missing distances come back as None -> NaN, which never passes a <= filter
+        self.load_arrays(rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2], {
+            'lake': rows[:, 3],
+            'restaurant_guesthouse': rows[:, 4]
+        })
+
+    def load_arrays(self, vertex_ids: np.ndarray, x: np.ndarray, y: np.ndarray,
+                    poi_distance: Dict[str, np.ndarray]) -> None:
+        """Use prepared arrays sorted by vertex_id (e.g. from a routing snapshot)"""
+        self.vertex_ids = vertex_ids
+        self.x = x
+        self.y = y
+        self.poi_distance = poi_distance
+
+        self.loaded = True
+        print(f"Loaded POI distances for {len(self.vertex_ids)} vertices")
+
+    def row_of(self, vertex_id: int) -> int:
+        """Return the array row of a vertex id"""
+        row = np.searchsorted(self.vertex_ids, vertex_id)
+        if row >= len(self.vertex_ids) or self.vertex_ids[row] != vertex_id:
+            raise ValueError(f"Vertex {vertex_id} not found in vertex POI index")
+        return int(row)
+
+    def ranked_bounce_candidates(self,
+                                 start_vertex_id: int,
+                                 target_distance: float,
+                                 poi_type: str,
+                                 max_poi_distance: float,
+                                 flexibility: float = 0.2,
+                                 network_distances: Optional[Dict[int, float]] = None) -> Iterator[Tuple[int, float]]:
+        """
+        Yield (vertex_id, poi_distance) for vertices in the annulus
+        target_distance * (1 +- flexibility) around the start vertex, best first.
+        The score normalizes POI distance and deviation from the target distance.
+        If network_distances (vertex_id -> trail distance) is given, the annulus is
+        measured along the network and unreached vertices are never candidates,
+        otherwise straight-line distance is used.
+        """
+        if network_distances is not None:
+            distance = self._network_distance_array(network_distances)
+        else:
+            start = self.row_of(start_vertex_id)
+            distance = np.hypot(self.x - self.x[start], self.y - self.y[start])
+        poi_distance = self.poi_distance[poi_type]
+
+        with np.errstate(invalid='ignore'):
+            mask = (
+                (np.abs(distance - target_distance) <= target_distance * flexibility)
+                & (poi_distance <= max_poi_distance)
+            )
+        candidates = np.flatnonzero(mask)
+
+        score = (
+            poi_distance[candidates] / max_poi_distance
+            + np.abs(distance[candidates] - target_distance) / target_distance
+        )
+        for row in candidates[np.argsort(score, kind='stable')]:
+            yield int(self.vertex_ids[row]), float(poi_distance[row])
+
+    def _network_distance_array(self, network_distances: Dict[int, float]) -> np.ndarray:
+        """Scatter a vertex_id -> distance mapping into an array aligned with vertex_ids"""
+        distance = np.full(len(self.vertex_ids), np.inf)
+        ids = np.fromiter(network_distances.keys(), dtype=np.int64, count=len(network_distances))
+        values = np.fromiter(network_distances.values(), dtype=float, count=len(network_distances))
+        rows = np.clip(np.searchsorted(self.vertex_ids, ids), 0, max(len(self.vertex_ids) - 1, 0))
+        known = self.vertex_ids[rows] == ids
+        distance[rows[known]] = values[known]
+        return distance
+
+# Shared index, loaded once at startup alongside the graphs
+vertex_poi_index = VertexPOIIndex()
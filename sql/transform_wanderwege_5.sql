@@ -1,239 +1,144 @@
 CREATE OR REPLACE PROCEDURE transform_wanderwege(
     source_table text DEFAULT 'wanderwege',
     target_vertices_table text DEFAULT 'wanderwege_vertices_3',
-    target_edges_table text DEFAULT 'wanderwege_edges_3'
+    target_edges_table text DEFAULT 'wanderwege_edges_3',
+    snap_tolerance float DEFAULT 0.001 -- Endpoints closer than this (meters) become one vertex
 )
 LANGUAGE plpgsql
 AS $$
-DECLARE
-    create_vertices_sql text;
-    create_edges_sql text;
 BEGIN
     RAISE NOTICE 'Starting wanderwege transformation procedure...';
 
-    RAISE NOTICE 'Creating % table...', target_vertices_table;
-    create_vertices_sql := format('
-        CREATE TABLE %I AS
-        SELECT DISTINCT ST_StartPoint(ST_GeometryN(geom, 1)) AS vertex FROM %I
-        UNION
-        SELECT DISTINCT ST_EndPoint(ST_GeometryN(geom, ST_NumGeometries(geom))) AS vertex FROM %I',
-        target_vertices_table, source_table, source_table
-    );
-    EXECUTE create_vertices_sql;
-
-    RAISE NOTICE 'Creating % table...', target_edges_table;
-    create_edges_sql := format('
-        CREATE TABLE %I AS
-        SELECT
-            id,
-            ST_StartPoint(ST_GeometryN(geom, 1)) AS source,
-            ST_EndPoint(ST_GeometryN(geom, ST_NumGeometries(geom))) AS target,
-            ST_Length(geom) AS length,
-            geom
-        FROM %I',
-        target_edges_table, source_table
-    );
-    EXECUTE create_edges_sql;
-
-    RAISE NOTICE 'Creating initial indexes...';
-    EXECUTE format('CREATE INDEX %I_vertex_idx ON %I USING GIST (vertex)', target_vertices_table, target_vertices_table);
-    EXECUTE format('CREATE INDEX %I_source_idx ON %I USING GIST (source)', target_edges_table, target_edges_table);
-    EXECUTE format('CREATE INDEX %I_target_idx ON %I USING GIST (target)', target_edges_table, target_edges_table);
-
-    RAISE NOTICE 'Adding vertex_id to %...', target_vertices_table;
-    EXECUTE format('ALTER TABLE %I ADD COLUMN vertex_id SERIAL PRIMARY KEY', target_vertices_table);
-
-    RAISE NOTICE 'Adding source and target vertex ID columns to %...', target_edges_table;
-    EXECUTE format('ALTER TABLE %I ADD COLUMN source_vertex_id INTEGER', target_edges_table);
-    EXECUTE format('ALTER TABLE %I ADD COLUMN target_vertex_id INTEGER', target_edges_table);
-
-    RAISE NOTICE 'Updating source vertex IDs...';
+    -- Endpoints keyed by their snapped coordinates, so vertex lookup is a hash join instead of ST_Equals
+    RAISE NOTICE 'Collecting snapped endpoints...';
+    DROP TABLE IF EXISTS topology_endpoints;
     EXECUTE format('
-        UPDATE %I e
-        SET source_vertex_id = v.vertex_id
-        FROM %I v
-        WHERE ST_Equals(e.source, v.vertex)',
-        target_edges_table, target_vertices_table
+        CREATE TEMP TABLE topology_endpoints AS
+        SELECT source_id, position, point,
+               ROUND(ST_X(point) / %s)::bigint AS kx,
+               ROUND(ST_Y(point) / %s)::bigint AS ky
+        FROM (
+            SELECT id AS source_id, 0 AS position, ST_StartPoint(ST_GeometryN(geom, 1)) AS point FROM %I
+            UNION ALL
+            SELECT id AS source_id, 1 AS position, ST_EndPoint(ST_GeometryN(geom, ST_NumGeometries(geom))) AS point FROM %I
+        ) endpoints',
+        snap_tolerance, snap_tolerance, source_table, source_table
     );
+    ANALYZE topology_endpoints;
 
-    RAISE NOTICE 'Updating target vertex IDs...';
-    EXECUTE format('
-        UPDATE %I e
-        SET target_vertex_id = v.vertex_id
-        FROM %I v
-        WHERE ST_Equals(e.target, v.vertex)',
-        target_edges_table, target_vertices_table
-    );
-
-    RAISE NOTICE 'Dropping old columns and renaming new ones...';
-    EXECUTE format('
-        ALTER TABLE %I 
-        DROP COLUMN source,
-        DROP COLUMN target',
-        target_edges_table
-    );
-
-    EXECUTE format('
-        ALTER TABLE %I 
-        RENAME COLUMN source_vertex_id TO source',
-        target_edges_table
-    );
-
-    EXECUTE format('
-        ALTER TABLE %I 
-        RENAME COLUMN target_vertex_id TO target',
-        target_edges_table
-    );
-
-    RAISE NOTICE 'Inserting reverse edges...';
-    EXECUTE format('
-        INSERT INTO %I (source, target, length, geom)
-        SELECT 
-            target AS source, 
-            source AS target, 
-            length, 
-            ST_Reverse(geom) AS geom
-        FROM %I e1
-        WHERE NOT EXISTS (
-            SELECT 1 
-            FROM %I e2
-            WHERE e2.source = e1.target 
-            AND e2.target = e1.source
-            AND e2.length = e1.length
-        )',
-        target_edges_table, target_edges_table, target_edges_table
-    );
-
-    RAISE NOTICE 'Adding metadata columns...';
-    EXECUTE format('
-        ALTER TABLE %I
-        ADD COLUMN datum_aend date,
-        ADD COLUMN datum_erst date,
-        ADD COLUMN erstellung bigint,
-        ADD COLUMN grund_aend character varying(50),
-        ADD COLUMN herkunft character varying(50),
-        ADD COLUMN objektart character varying(50),
-        ADD COLUMN revision_j bigint,
-        ADD COLUMN revision_m bigint,
-        ADD COLUMN kunstbaute character varying(30),
-        ADD COLUMN belagsart character varying(10),
-        ADD COLUMN eigentueme character varying(50),
-        ADD COLUMN strassenna character varying(254),
-        ADD COLUMN wanderwege character varying(50),
-        ADD COLUMN befahrbark character varying(10),
-        ADD COLUMN stufe character varying(5),
-        ADD COLUMN richtungsg character varying(10),
-        ADD COLUMN verkehrsbe character varying(50),
-        ADD COLUMN kreisel character varying(10)',
-        target_edges_table
-    );
-
-    RAISE NOTICE 'Updating edges with metadata...';
-    EXECUTE format('
-        UPDATE %I e
-        SET 
-            datum_aend = s.datum_aend,
-            datum_erst = s.datum_erst,
-            erstellung = s.erstellung,
-            grund_aend = s.grund_aend,
-            herkunft = s.herkunft,
-            objektart = s.objektart,
-            revision_j = s.revision_j,
-            revision_m = s.revision_m,
-            kunstbaute = s.kunstbaute,
-            belagsart = s.belagsart,
-            eigentueme = s.eigentueme,
-            strassenna = s.strassenna,
-            wanderwege = s.wanderwege,
-            befahrbark = s.befahrbark,
-            stufe = s.stufe,
-            richtungsg = s.richtungsg,
-            verkehrsbe = s.verkehrsbe,
-            kreisel = s.kreisel
-        FROM 
-            %I s
-        WHERE 
-            ST_Intersects(e.geom::geometry, s.geom::geometry)',
-        target_edges_table, source_table
-    );
-
-    RAISE NOTICE 'Creating metadata index...';
-    EXECUTE format('CREATE INDEX %I_idx_strassenna ON %I(strassenna)', target_edges_table, target_edges_table);
-
-    RAISE NOTICE 'Replacing id column...';
-    EXECUTE format('ALTER TABLE %I DROP COLUMN id', target_edges_table);
-    EXECUTE format('ALTER TABLE %I ADD COLUMN id SERIAL PRIMARY KEY', target_edges_table);
-
-    RAISE NOTICE 'Adding elevation difference column...';
-    EXECUTE format('ALTER TABLE %I ADD COLUMN elevation_difference DOUBLE PRECISION', target_edges_table);
-
-    RAISE NOTICE 'Calculating elevation differences...';
-    EXECUTE format('
-        UPDATE %I AS edges
-        SET elevation_difference = ST_Z(end_vertex.vertex) - ST_Z(start_vertex.vertex)
-        FROM %I AS start_vertex, %I AS end_vertex
-        WHERE edges.source = start_vertex.vertex_id
-          AND edges.target = end_vertex.vertex_id',
-        target_edges_table, target_vertices_table, target_vertices_table
-    );
-
-    RAISE NOTICE 'Adding cost column...';
-    EXECUTE format('ALTER TABLE %I ADD COLUMN cost DOUBLE PRECISION', target_edges_table);
-    EXECUTE format('UPDATE %I SET cost = 1', target_edges_table);
-
-    RAISE NOTICE 'Adding tobler duration column...';
-    EXECUTE format('ALTER TABLE %I ADD COLUMN tobler_duration DOUBLE PRECISION', target_edges_table);
-
-    RAISE NOTICE 'Rounding numeric values...';
+    -- One vertex per key, ids follow the key order so every rebuild assigns the same ids
+    RAISE NOTICE 'Creating % table...', target_vertices_table;
     EXECUTE format('
-        UPDATE %I 
-        SET elevation_difference = ROUND(elevation_difference::numeric, 2),
-            length = ROUND(length::numeric, 2)',
-        target_edges_table
+        CREATE TABLE %I AS
+        SELECT (ROW_NUMBER() OVER (ORDER BY kx, ky))::integer AS vertex_id, kx, ky, vertex
+        FROM (
+            SELECT DISTINCT ON (kx, ky) kx, ky, point AS vertex
+            FROM topology_endpoints
+            ORDER BY kx, ky, source_id, position
+        ) keyed',
+        target_vertices_table
     );
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (vertex_id)', target_vertices_table);
 
-    RAISE NOTICE 'Calculating tobler duration...';
+    -- Forward and reverse edge per source line; duplicates (same source, target and length)
+    -- keep the lowest source id, forward before reverse. Metadata is joined by source id.
+    RAISE NOTICE 'Creating % table...', target_edges_table;
     EXECUTE format('
-        UPDATE %I
-        SET tobler_duration = 
-            CASE 
-                WHEN length < 0.1 THEN NULL
-                ELSE 
-                    GREATEST(0.02, 
+        CREATE TABLE %1$I AS
+        WITH lines AS (
+            SELECT
+                se.source_id,
+                sv.vertex_id AS source,
+                tv.vertex_id AS target,
+                ST_Z(tv.vertex) - ST_Z(sv.vertex) AS elevation_difference
+            FROM topology_endpoints se
+            JOIN topology_endpoints te ON te.source_id = se.source_id AND te.position = 1
+            JOIN %2$I sv ON sv.kx = se.kx AND sv.ky = se.ky
+            JOIN %2$I tv ON tv.kx = te.kx AND tv.ky = te.ky
+            WHERE se.position = 0
+        ),
+        directed AS (
+            SELECT l.source_id, 0 AS direction, l.source, l.target,
+                   ROUND(ST_Length(s.geom)::numeric, 2)::float AS length,
+                   ROUND(l.elevation_difference::numeric, 2)::float AS elevation_difference
+            FROM lines l JOIN %3$I s ON s.id = l.source_id
+            UNION ALL
+            SELECT l.source_id, 1 AS direction, l.target, l.source,
+                   ROUND(ST_Length(s.geom)::numeric, 2)::float AS length,
+                   ROUND(-l.elevation_difference::numeric, 2)::float AS elevation_difference
+            FROM lines l JOIN %3$I s ON s.id = l.source_id
+        ),
+        unique_edges AS (
+            SELECT DISTINCT ON (source, target, length) *
+            FROM directed
+            ORDER BY source, target, length, source_id, direction
+        )
+        SELECT
+            (ROW_NUMBER() OVER (ORDER BY e.source_id, e.direction))::integer AS id,
+            e.source_id,
+            e.source,
+            e.target,
+            e.length,
+            CASE WHEN e.direction = 0 THEN s.geom ELSE ST_Reverse(s.geom) END AS geom,
+            s.datum_aend::date AS datum_aend,
+            s.datum_erst::date AS datum_erst,
+            s.erstellung::bigint AS erstellung,
+            s.grund_aend::character varying(50) AS grund_aend,
+            s.herkunft::character varying(50) AS herkunft,
+            s.objektart::character varying(50) AS objektart,
+            s.revision_j::bigint AS revision_j,
+            s.revision_m::bigint AS revision_m,
+            s.kunstbaute::character varying(30) AS kunstbaute,
+            s.belagsart::character varying(10) AS belagsart,
+            s.eigentueme::character varying(50) AS eigentueme,
+            s.strassenna::character varying(254) AS strassenna,
+            s.wanderwege::character varying(50) AS wanderwege,
+            s.befahrbark::character varying(10) AS befahrbark,
+            s.stufe::character varying(5) AS stufe,
+            s.richtungsg::character varying(10) AS richtungsg,
+            s.verkehrsbe::character varying(50) AS verkehrsbe,
+            s.kreisel::character varying(10) AS kreisel,
+            e.elevation_difference,
+            1::double precision AS cost,
+            CASE
+                WHEN e.length < 0.1 THEN NULL
+                ELSE
+                    GREATEST(0.02,
                         ROUND(
-                            (length::float / (
-                                6 * 
-                                GREATEST(0.000001, 
-                                    EXP(-3.5 * LEAST(1.0, ABS(elevation_difference::float / NULLIF(length::float, 0))))
-                                ) * 
+                            (e.length::float / (
+                                6 *
+                                GREATEST(0.000001,
+                                    EXP(-3.5 * LEAST(1.0, ABS(e.elevation_difference::float / NULLIF(e.length::float, 0))))
+                                ) *
                                 (1000.0 / 3600.0)
-                            ))::numeric, 
+                            ))::numeric,
                             2
                         )
-                    )
-            END',
-        target_edges_table
+                    )::double precision
+            END AS tobler_duration
+        FROM unique_edges e
+        JOIN %3$I s ON s.id = e.source_id',
+        target_edges_table, target_vertices_table, source_table
     );
 
-    RAISE NOTICE 'Creating additional indexes...';
+    RAISE NOTICE 'Dropping snapping keys...';
+    EXECUTE format('ALTER TABLE %I DROP COLUMN kx, DROP COLUMN ky', target_vertices_table);
+    DROP TABLE topology_endpoints;
+
+    RAISE NOTICE 'Creating indexes...';
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id)', target_edges_table);
+    EXECUTE format('CREATE INDEX %I_vertex_idx ON %I USING GIST (vertex)', target_vertices_table, target_vertices_table);
+    EXECUTE format('CREATE INDEX %I_idx_strassenna ON %I(strassenna)', target_edges_table, target_edges_table);
     EXECUTE format('CREATE INDEX %I_geom_idx ON %I USING GIST (geom)', target_edges_table, target_edges_table);
     EXECUTE format('CREATE INDEX %I_source_idx ON %I(source)', target_edges_table, target_edges_table);
     EXECUTE format('CREATE INDEX %I_target_idx ON %I(target)', target_edges_table, target_edges_table);
+    EXECUTE format('CREATE INDEX %I_source_id_idx ON %I(source_id)', target_edges_table, target_edges_table);
     EXECUTE format('CREATE INDEX idx_%I_path ON %I(source, target, length)', target_edges_table, target_edges_table);
     EXECUTE format('CREATE INDEX idx_%I_tobler ON %I(tobler_duration)', target_edges_table, target_edges_table);
-    EXECUTE format('CREATE INDEX idx_%I_cost_comp ON %I(length, elevation_difference, tobler_duration)', 
+    EXECUTE format('CREATE INDEX idx_%I_cost_comp ON %I(length, elevation_difference, tobler_duration)',
         target_edges_table, target_edges_table);
 
     RAISE NOTICE 'Wanderwege transformation procedure completed successfully.';
     COMMIT;
 END;
 $$;
-    
-
--- we still need to manually remove duplicates, for whatever reason ...
-DELETE FROM wanderwege_edges_3 a
-USING wanderwege_edges_3 b
-WHERE a.id > b.id 
-  AND a.source = b.source 
-  AND a.target = b.target 
-  AND a.length = b.length;     
\ No newline at end of file
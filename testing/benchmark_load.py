@@ -0,0 +1,229 @@
+"""
+Concurrent load benchmark for the /hike endpoint.
+
+Replays the Rigi/Bern optimization matrix of test_explore.py (and optionally the
+length matrix of test_length.py) at a configurable concurrency and reports
+p50/p95/p99 latency and throughput per combination. Results are written as JSON
+so two runs (e.g. two commits) can be diffed with --compare.
+
+Run it against a local server backed by the fixture database, e.g.
+    python testing/benchmark_load.py --concurrency 8 --samples 20
+    python testing/benchmark_load.py --compare tests/results/load_<old>.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+
+# Configuration
+BASE_URL = "http://127.0.0.1:8001"
+RESULTS_DIR = "tests/results"
+
+LOCATIONS = {
+    "rigi": {"lat": 47.0426107, "lon": 8.4872653},
+    "bern": {"lat": 46.93703929969877, "lon": 7.43319760631916}
+}
+OPTIMIZATION_TYPES = ['gain', 'loss', 'level', 'hard', 'natural', 'hiking', 'mountain']
+DESIRED_LENGTHS = [1000, 5000, 10000, 15000, 20000]
+
+def build_route_params(location: str, optimization_type: str, desired_length: Optional[int] = None) -> Dict:
+    """
+    Request body for one combination. Without desired_length these are the settings of
+    test_explore.py (5 km, 5 km radius), with it those of test_length.py (radius grows with the length).
+    The trail branch is test_explore.py's as well, so 'mountain' is sent without a trail weight
+    and the default 'hiking' trail type, exactly like the requests it replays.
+    """
+    params = {
+        "start": LOCATIONS[location],
+        "desired_length": desired_length or 5000,
+        "radius": max(desired_length * 2, 5000) if desired_length else 5000,
+        "elevation_weight": 0,
+        "surface_weight": 0,
+        "trail_weight": 0,
+        "prefer_hard_surface": False,
+        "preferred_trail_type": "hiking",
+        "mode": "explore",
+        "is_minutes": False,
+        "is_sunday": False,
+        "poi_preferences": {
+            "lake": False,
+            "lake_sizes": ["M"],
+            "lake_distance": 5000,
+            "avoid_urban": False,
+            "urban_distance": 5000,
+            "restaurant": False,
+            "restaurant_distance": 1000,
+            "min_restaurant_density": 1
+        }
+    }
+
+    if optimization_type in ['gain', 'loss', 'level']:
+        params['elevation'] = optimization_type
+        params['elevation_weight'] = 1
+    elif optimization_type in ['hard', 'natural']:
+        params['surface_weight'] = 1
+        params['prefer_hard_surface'] = (optimization_type == 'hard')
+    elif optimization_type in ['hiking', 'trail']:
+        params['trail_weight'] = 1
+        params['preferred_trail_type'] = optimization_type
+
+    return params
+
+def build_matrix(include_lengths: bool) -> List[Dict]:
+    """All (name, params) combinations to replay"""
+    matrix = []
+    for location in LOCATIONS:
+        for optimization_type in OPTIMIZATION_TYPES:
+            matrix.append({
+                "name": f"{location}/{optimization_type}",
+                "params": build_route_params(location, optimization_type)
+            })
+        if include_lengths:
+            for desired_length in DESIRED_LENGTHS:
+                matrix.append({
+                    "name": f"{location}/length_{desired_length}",
+                    # test_length.py always optimizes for natural surface
+                    "params": build_route_params(location, 'natural', desired_length)
+                })
+    return matrix
+
+def timed_request(session: requests.Session, base_url: str, name: str, params: Dict, timeout: float) -> Dict:
+    """Issue one request and return its latency and outcome"""
+    start_time = time.perf_counter()
+    try:
+        response = session.post(f"{base_url}/hike", json=params, timeout=timeout)
+        ok = response.status_code == 200
+        status = response.status_code
+    except requests.exceptions.RequestException as e:
+        ok = False
+        status = type(e).__name__
+    return {"name": name, "ok": ok, "status": status, "latency": time.perf_counter() - start_time}
+
+def summarize(latencies: List[float], errors: int, wall_time: float) -> Dict:
+    """Latency percentiles (seconds) and throughput for a set of requests"""
+    values = np.array(latencies) if latencies else np.array([np.nan])
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p95": round(float(np.percentile(values, 95)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+        "mean": round(float(np.mean(values)), 4),
+        "throughput_rps": round(len(latencies) / wall_time, 3) if wall_time > 0 else 0.0
+    }
+
+def run_benchmark(base_url: str, concurrency: int, samples: int, include_lengths: bool,
+                  timeout: float = 120.0) -> Dict:
+    """Replay every combination `samples` times with `concurrency` requests in flight"""
+    matrix = build_matrix(include_lengths)
+    jobs = [combination for combination in matrix for _ in range(samples)]
+    print(f"Running {len(jobs)} requests ({len(matrix)} combinations x {samples}) at concurrency {concurrency}...")
+
+    local = threading.local()
+
+    def worker(combination):
+        # One keep-alive session per worker thread
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return timed_request(local.session, base_url, combination["name"], combination["params"], timeout)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, jobs))
+    wall_time = time.perf_counter() - start_time
+
+    combinations = {}
+    for combination in matrix:
+        name = combination["name"]
+        rows = [r for r in results if r["name"] == name]
+        latencies = [r["latency"] for r in rows if r["ok"]]
+        # Per-combination throughput is relative to the whole run, the overall number is the meaningful one
+        combinations[name] = summarize(latencies, len(rows) - len(latencies), wall_time)
+
+    overall_latencies = [r["latency"] for r in results if r["ok"]]
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": current_commit(),
+            "base_url": base_url,
+            "concurrency": concurrency,
+            "samples": samples,
+            "wall_time": round(wall_time, 3)
+        },
+        "overall": summarize(overall_latencies, len(results) - len(overall_latencies), wall_time),
+        "combinations": combinations
+    }
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    """List combinations whose p50/p95/p99 got slower than baseline by more than threshold"""
+    regressions = []
+    for name, stats in current["combinations"].items():
+        old = baseline.get("combinations", {}).get(name)
+        if not old:
+            continue
+        for percentile in ["p50", "p95", "p99"]:
+            if old[percentile] and stats[percentile] > old[percentile] * (1 + threshold):
+                regressions.append(
+                    f"{name} {percentile}: {old[percentile]:.3f}s -> {stats[percentile]:.3f}s "
+                    f"(+{(stats[percentile] / old[percentile] - 1) * 100:.1f}%)"
+                )
+    return regressions
+
+def print_report(result: Dict) -> None:
+    print(f"\n{'combination':<24} {'n':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, stats in result["combinations"].items():
+        print(f"{name:<24} {stats['requests']:>5} {stats['errors']:>4} "
+              f"{stats['p50']:>8.3f} {stats['p95']:>8.3f} {stats['p99']:>8.3f}")
+    overall = result["overall"]
+    print(f"\nOverall: p50 {overall['p50']:.3f}s, p95 {overall['p95']:.3f}s, p99 {overall['p99']:.3f}s, "
+          f"{overall['throughput_rps']:.2f} req/s, {overall['errors']} errors")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load benchmark for the /hike endpoint")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--samples", type=int, default=10, help="Requests per combination")
+    parser.add_argument("--lengths", action="store_true", help="Also replay the desired-length matrix")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Result file (default: tests/results/load_<timestamp>.json)")
+    parser.add_argument("--compare", help="Baseline result file to diff against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown before flagging (0.1 = 10%%)")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.base_url, args.concurrency, args.samples, args.lengths, args.timeout)
+    print_report(result)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    print(f"\nSaved results to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, args.threshold)
+        if regressions:
+            print(f"\nRegressions against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            raise SystemExit(1)
+        print(f"\nNo regressions against {args.compare}")
+
+if __name__ == "__main__":
+    main()
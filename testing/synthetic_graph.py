@@ -0,0 +1,130 @@
+"""
+Synthetic hiking networks for benchmarks that must run without PostGIS.
+
+Edges are generated as rows shaped like the wanderwege_edges_3 query in
+GraphManager.build_graph, so the same rows can be fed through build_graph
+(via SyntheticCursor) or turned into a graph directly.
+"""
+import math
+import random
+import struct
+from typing import List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+
+# Rough shares observed on the Swiss hiking network
+SURFACES = (['Hart', 'Natur', None], [0.40, 0.55, 0.05])
+TRAIL_TYPES = (['Wanderweg', 'Bergwanderweg', 'Alpinwanderweg', None], [0.60, 0.25, 0.03, 0.12])
+
+def terrain_height(x: np.ndarray, y: np.ndarray, relief: float = 400.0) -> np.ndarray:
+    """Smooth hilly terrain (meters) from a few overlapping sine waves"""
+    return (
+        relief * 0.5 * np.sin(x / 3000.0) * np.cos(y / 4000.0)
+        + relief * 0.3 * np.sin((x + y) / 1500.0)
+        + relief * 0.2 * np.cos(x / 700.0 - y / 900.0)
+    )
+
+def tobler_duration(length: float, elevation_difference: float) -> Optional[float]:
+    """Walking time in seconds, same formula as transform_wanderwege"""
+    if length < 0.1:
+        return None
+    slope = min(1.0, abs(elevation_difference / length))
+    return max(0.02, round(length / (6 * max(0.000001, math.exp(-3.5 * slope)) * (1000.0 / 3600.0)), 2))
+
+def line_ewkb(start: Tuple[float, float, float], end: Tuple[float, float, float], srid: int = 2056) -> str:
+    """Straight LineString Z as hex EWKB, the form psycopg2 returns for the geom column"""
+    return struct.pack('<BIII6d', 1, 0xA0000002, srid, 2, *start, *end).hex()
+
+def _edge_rows(x: np.ndarray, y: np.ndarray, pairs: List[Tuple[int, int]], seed: int) -> List[Tuple]:
+    rng = random.Random(seed)
+    z = terrain_height(x, y)
+    rows = []
+    edge_id = 1
+    for u, v in pairs:
+        # Trails are never straight, stretch the straight-line distance a bit
+        length = round(float(math.hypot(x[v] - x[u], y[v] - y[u])) * rng.uniform(1.0, 1.4), 2)
+        elevation_difference = round(float(z[v] - z[u]), 2)
+        surface = rng.choices(*SURFACES)[0]
+        trail_type = rng.choices(*TRAIL_TYPES)[0]
+        for source, target, diff in ((u, v, elevation_difference), (v, u, -elevation_difference)):
+            geom = line_ewkb((x[source], y[source], z[source]), (x[target], y[target], z[target]))
+            rows.append((edge_id, source, target, length, diff, surface, trail_type,
+                         tobler_duration(length, diff), geom))
+            edge_id += 1
+    return rows
+
+def grid_coordinates(side: int, spacing: float = 150.0, seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """Vertex coordinates of grid_edges, indexed by vertex id"""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(side * side)
+    x = (ids % side) * spacing + rng.normal(0, spacing * 0.15, len(ids))
+    y = (ids // side) * spacing + rng.normal(0, spacing * 0.15, len(ids))
+    return x, y
+
+def grid_edges(side: int, spacing: float = 150.0, seed: int = 42) -> List[Tuple]:
+    """Jittered square grid with side * side vertices, both edge directions"""
+    x, y = grid_coordinates(side, spacing, seed)
+    pairs = []
+    for i in range(side):
+        for j in range(side):
+            vertex = i * side + j
+            if j + 1 < side:
+                pairs.append((vertex, vertex + 1))
+            if i + 1 < side:
+                pairs.append((vertex, vertex + side))
+    return _edge_rows(x, y, pairs, seed)
+
+def random_geometric_coordinates(num_vertices: int, spacing: float = 150.0,
+                                 seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """Vertex coordinates of random_geometric_edges, indexed by vertex id"""
+    rng = np.random.default_rng(seed)
+    extent = math.sqrt(num_vertices) * spacing
+    return rng.uniform(0, extent, num_vertices), rng.uniform(0, extent, num_vertices)
+
+def random_geometric_edges(num_vertices: int, mean_degree: float = 4.0, spacing: float = 150.0,
+                           seed: int = 42) -> List[Tuple]:
+    """Random geometric graph with roughly mean_degree neighbours per vertex, both edge directions"""
+    x, y = random_geometric_coordinates(num_vertices, spacing, seed)
+    extent = math.sqrt(num_vertices) * spacing
+    radius = math.sqrt(mean_degree / (math.pi * num_vertices)) * extent
+
+    # Bucket vertices into radius-sized cells so only neighbouring cells are compared
+    cells = {}
+    for vertex, key in enumerate(zip((x // radius).astype(int), (y // radius).astype(int))):
+        cells.setdefault(key, []).append(vertex)
+    pairs = []
+    for (cx, cy), members in cells.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for v in cells.get((cx + dx, cy + dy), []):
+                    for u in members:
+                        if u < v and math.hypot(x[v] - x[u], y[v] - y[u]) <= radius:
+                            pairs.append((u, v))
+    return _edge_rows(x, y, pairs, seed)
+
+def build_synthetic_graph(rows: List[Tuple]) -> nx.DiGraph:
+    """Graph with the same edge attributes GraphManager.build_graph creates"""
+    G = nx.DiGraph()
+    for edge in rows:
+        G.add_edge(edge[1], edge[2], edge_id=edge[0], length=edge[3], elevation_diff=edge[4],
+                   surface=edge[5], trail_type=edge[6], duration=edge[7], geom=edge[8])
+    return G
+
+def central_vertex(G: nx.DiGraph) -> int:
+    """Middle vertex id of the largest component (the grid centre for grid graphs)"""
+    nodes = sorted(max(nx.weakly_connected_components(G), key=len))
+    return nodes[len(nodes) // 2]
+
+class SyntheticCursor:
+    """Minimal cursor returning synthetic edge rows for GraphManager.build_graph"""
+
+    def __init__(self, rows: List[Tuple]):
+        self.rows = rows
+        self.query: Optional[str] = None
+
+    def execute(self, query, vars=None):
+        self.query = query
+
+    def fetchall(self):
+        return self.rows
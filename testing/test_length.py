@@ -7,6 +7,10 @@ from datetime import datetime
 import json
 import pandas as pd
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+from route_stats import EdgeArrays, route_statistics
 
 # Configuration
 BASE_URL = "http://127.0.0.1:8001"
@@ -15,48 +19,19 @@ RESULTS_DIR = "tests/results"
 
 def calculate_surface_metrics(features):
     """Calculate percentage of hard vs natural surface"""
-    total_length = 0
-    hard_surface_length = 0
-    
-    for feature in features:
-        length = feature['properties']['length']
-        total_length += length
-        if feature['properties']['belagsart'] == 'Hart':
-            hard_surface_length += length
-    
-    hard_surface_percentage = (hard_surface_length / total_length * 100) if total_length > 0 else 0
-    natural_surface_percentage = 100 - hard_surface_percentage
-    
+    stats = route_statistics(EdgeArrays.from_features(features))
     return {
-        'hard_surface_percentage': round(hard_surface_percentage, 2),
-        'natural_surface_percentage': round(natural_surface_percentage, 2)
+        'hard_surface_percentage': stats['hard_surface_percentage'],
+        'natural_surface_percentage': stats['natural_surface_percentage']
     }
 
 def calculate_trail_metrics(features):
     """Calculate percentage of different trail types"""
-    total_length = 0
-    trail_lengths = {'Wanderweg': 0, 'Bergwanderweg': 0, 'Street': 0}
-    
-    for feature in features:
-        length = feature['properties']['length']
-        total_length += length
-        trail_type = feature['properties']['trail_type']
-        
-        # Add length to appropriate category
-        if trail_type in ['Wanderweg', 'Bergwanderweg']:
-            trail_lengths[trail_type] += length
-        else:
-            trail_lengths['Street'] += length
-    
-    # Calculate percentages
-    hiking_percentage = (trail_lengths['Wanderweg'] / total_length * 100) if total_length > 0 else 0
-    mountain_percentage = (trail_lengths['Bergwanderweg'] / total_length * 100) if total_length > 0 else 0
-    street_percentage = (trail_lengths['Street'] / total_length * 100) if total_length > 0 else 0
-    
+    stats = route_statistics(EdgeArrays.from_features(features))
     return {
-        'hiking_percentage': round(hiking_percentage, 2),
-        'trail_percentage': round(mountain_percentage, 2),
-        'street_percentage': round(street_percentage, 2)
+        'hiking_percentage': stats['hiking_percentage'],
+        'trail_percentage': stats['trail_percentage'],
+        'street_percentage': stats['street_percentage']
     }
 
 def make_route_request(params: Dict) -> Dict:
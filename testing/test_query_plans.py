@@ -0,0 +1,91 @@
+import pytest
+import psycopg2
+from typing import List, Dict
+from datetime import datetime
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+from db_pool import PreparingConnection, closest_vertices_statement, execute_prepared
+
+# Configuration
+DSN = os.environ.get("GO_WANDR_TEST_DSN")
+RESULTS_DIR = "tests/results"
+NUM_RUNS = 20  # Executions per statement for the timing benchmark
+
+LOCATIONS = {
+    "rigi": {"lat": 47.0426107, "lon": 8.4872653, "lv95": "POINT(2679500 1212300)"},
+    "bern": {"lat": 46.93703929969877, "lon": 7.43319760631916, "lv95": "POINT(2600500 1199500)"}
+}
+
+# GiST indexes created by transform_transport_stops.sql and transform_wanderwege_5.sql
+STOPS_INDEX = "stops_geom_idx"
+VERTICES_INDEX = "wanderwege_vertices_3_vertex_idx"
+
+pytestmark = pytest.mark.skipif(not DSN, reason="GO_WANDR_TEST_DSN not set")
+
+def statement_cases() -> List[Dict]:
+    cases = []
+    for location, coords in LOCATIONS.items():
+        cases.append({"location": location, "statement": "nearest_stations",
+                      "params": (coords["lon"], coords["lat"], 5000), "index": STOPS_INDEX})
+        cases.append({"location": location, "statement": "nearest_end_stop",
+                      "params": (coords["lon"], coords["lat"]), "index": STOPS_INDEX})
+        cases.append({"location": location, "statement": closest_vertices_statement("wanderwege_vertices_3"),
+                      "params": (coords["lv95"], coords["lv95"]), "index": VERTICES_INDEX})
+    return cases
+
+def collect_index_names(plan: Dict) -> List[str]:
+    """Collect the names of all indexes used anywhere in an EXPLAIN JSON plan"""
+    names = [plan["Index Name"]] if "Index Name" in plan else []
+    for child in plan.get("Plans", []):
+        names.extend(collect_index_names(child))
+    return names
+
+@pytest.fixture(scope="module")
+def cur():
+    conn = psycopg2.connect(DSN, connection_factory=PreparingConnection)
+    cur = conn.cursor()
+    yield cur
+    cur.close()
+    conn.close()
+
+@pytest.fixture(scope="module")
+def plan_results():
+    """Collects plans and timings, written once the module's tests are done so runs can be compared between commits"""
+    results = []
+    yield results
+    if results:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        with open(os.path.join(RESULTS_DIR, f"query_plans_{timestamp}.json"), "w") as f:
+            json.dump(results, f, indent=2)
+
+@pytest.mark.parametrize("case", statement_cases(), ids=lambda c: f"{c['location']}-{c['statement']}")
+def test_prepared_statement_uses_gist_index(cur, plan_results, case):
+    """Prepared KNN lookups must be answered by the GiST indexes, not a sequential scan"""
+    # First execution prepares the statement on this connection
+    execute_prepared(cur, case["statement"], case["params"])
+    cur.fetchall()
+
+    placeholders = ', '.join(['%s'] * len(case["params"]))
+    cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) EXECUTE {case['statement']} ({placeholders})", case["params"])
+    explain = cur.fetchone()[0][0]
+    index_names = collect_index_names(explain["Plan"])
+
+    assert any(name.startswith(case["index"]) for name in index_names), \
+        f"{case['statement']} does not use {case['index']}, indexes used: {index_names}"
+
+    execution_times = []
+    for _ in range(NUM_RUNS):
+        cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) EXECUTE {case['statement']} ({placeholders})", case["params"])
+        execution_times.append(cur.fetchone()[0][0]["Execution Time"])
+
+    plan_results.append({
+        "location": case["location"],
+        "statement": case["statement"],
+        "indexes": index_names,
+        "mean_execution_ms": round(sum(execution_times) / len(execution_times), 3),
+        "max_execution_ms": round(max(execution_times), 3)
+    })
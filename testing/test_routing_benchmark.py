@@ -0,0 +1,176 @@
+import pytest
+import os
+import sys
+import math
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+pytest.importorskip("pytest_benchmark")
+# models and cost_utils come with the API, psycopg2 with db_pool; without them the suite is skipped
+for module in ("models", "cost_utils", "psycopg2"):
+    pytest.importorskip(module)
+
+from graph_manager import GraphManager, select_pareto_route
+from street_graph_manager import StreetGraphManager
+from models import ElevationType, TrailType
+from synthetic_graph import (grid_edges, random_geometric_edges, grid_coordinates, random_geometric_coordinates,
+                             build_synthetic_graph, central_vertex, SyntheticCursor)
+
+# Run with: pytest testing/test_routing_benchmark.py --benchmark-json=tests/results/routing.json
+GRAPHS = {
+    "grid_900": lambda: grid_edges(30),
+    "grid_10k": lambda: grid_edges(100),
+    "grid_40k": lambda: grid_edges(200),
+    "rgg_1k": lambda: random_geometric_edges(1000),
+    "rgg_10k": lambda: random_geometric_edges(10000),
+}
+COORDINATES = {
+    "grid_900": lambda: grid_coordinates(30),
+    "grid_10k": lambda: grid_coordinates(100),
+    "grid_40k": lambda: grid_coordinates(200),
+    "rgg_1k": lambda: random_geometric_coordinates(1000),
+    "rgg_10k": lambda: random_geometric_coordinates(10000),
+}
+WEIGHTS = {'elevation': 1.0, 'surface': 0.5, 'trail': 0.5}
+
+_rows_cache = {}
+
+def edge_rows(name):
+    if name not in _rows_cache:
+        _rows_cache[name] = GRAPHS[name]()
+    return _rows_cache[name]
+
+def assert_valid_path(G, path, start):
+    """Path starts at start and only follows edges of the graph"""
+    assert path[0] == start
+    assert all(G.has_edge(u, v) for u, v in zip(path[:-1], path[1:]))
+
+def path_length(G, path):
+    return sum(G[u][v]['length'] for u, v in zip(path[:-1], path[1:]))
+
+def graph_manager(name, cls=GraphManager):
+    manager = cls()
+    manager.G = build_synthetic_graph(edge_rows(name))
+    manager.graph_built = True
+    return manager
+
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_build_graph(benchmark, tmp_path, graph):
+    """Graph construction from edge rows (cold, no pickle cache)"""
+    rows = edge_rows(graph)
+
+    def setup():
+        cache_file = tmp_path / "graph.pickle"
+        if cache_file.exists():
+            cache_file.unlink()
+        return (GraphManager(cache_file=str(cache_file)), SyntheticCursor(rows)), {}
+
+    benchmark.pedantic(lambda manager, cur: manager.build_graph(cur), setup=setup, rounds=3)
+
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_edge_costs(benchmark, graph):
+    """Weighted cost of every edge, the work done per relaxation"""
+    manager = graph_manager(graph)
+    edges = [d for _, _, d in manager.G.edges(data=True)]
+
+    def run():
+        return [manager._weighted_edge_cost(d, WEIGHTS, ElevationType.ELEVATION_GAIN, True, TrailType.HIKING)
+                for d in edges]
+
+    costs = benchmark(run)
+    assert len(costs) == len(edges)
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("desired_length", [2000, 4000])
+def test_find_exploration_path(benchmark, graph, desired_length):
+    manager = graph_manager(graph)
+    start = central_vertex(manager.G)
+
+    result = benchmark(
+        manager.find_exploration_path, None, start, desired_length, WEIGHTS, 0.1, [],
+        ElevationType.ELEVATION_GAIN, True, TrailType.HIKING
+    )
+    assert_valid_path(manager.G, result['path'], start)
+    assert result['total_length'] == pytest.approx(path_length(manager.G, result['path']))
+    assert desired_length * 0.9 <= result['total_length'] <= desired_length * 1.1
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("minutes", [(20, 40), (45, 60)])
+def test_find_duration_path(benchmark, graph, minutes):
+    manager = graph_manager(graph)
+    start = central_vertex(manager.G)
+
+    result = benchmark(
+        manager.find_duration_path, start, minutes[0], minutes[1], WEIGHTS, [],
+        ElevationType.ELEVATION_GAIN, True, TrailType.HIKING
+    )
+    assert_valid_path(manager.G, result['path'], start)
+    assert minutes[0] <= result['total_minutes'] <= minutes[1]
+    path_minutes = sum(manager.G[u][v]['duration'] or 0.0 for u, v in zip(result['path'][:-1], result['path'][1:])) / 60
+    assert result['total_minutes'] == pytest.approx(path_minutes, abs=0.05)
+
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_find_pareto_paths(benchmark, graph):
+    manager = graph_manager(graph)
+    start = central_vertex(manager.G)
+
+    routes = benchmark(
+        manager.find_pareto_paths, start, 2000, 0.1,
+        ElevationType.ELEVATION_GAIN, True, TrailType.HIKING
+    )
+    assert routes
+    for route in routes:
+        assert_valid_path(manager.G, route['path'], start)
+        assert 1800 <= route['total_length'] <= 2200
+    # No returned route is dominated by another on all three cost criteria
+    costs = [tuple(route['costs'].values()) for route in routes]
+    for i, a in enumerate(costs):
+        assert not any(j != i and all(x <= y for x, y in zip(b, a)) and b != a for j, b in enumerate(costs))
+    assert select_pareto_route(routes, WEIGHTS) in routes
+
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_find_exploration_alternatives(benchmark, graph):
+    manager = graph_manager(graph)
+    start = central_vertex(manager.G)
+
+    routes = benchmark(
+        manager.find_exploration_alternatives, None, start, 2000, WEIGHTS, 0.1, [],
+        ElevationType.ELEVATION_GAIN, True, TrailType.HIKING
+    )
+    assert 1 <= len(routes) <= 5
+    for route in routes:
+        assert_valid_path(manager.G, route['path'], start)
+        assert 1800 <= route['total_length'] <= 2200
+    # End points are pairwise at least the default separation (a quarter of the length) apart
+    x, y = COORDINATES[graph]()
+    ends = [route['end_vertex'] for route in routes]
+    for i, u in enumerate(ends):
+        for v in ends[i + 1:]:
+            assert math.hypot(x[u] - x[v], y[u] - y[v]) >= 500
+
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_find_path_to_target(benchmark, graph):
+    manager = graph_manager(graph)
+    start = central_vertex(manager.G)
+    # The farthest vertex within 3 km trail distance makes a realistic bounce target
+    distances = manager.network_distances(start, 3000)
+    target = max(distances, key=distances.get)
+
+    result = benchmark(
+        manager.find_path_to_target, start, target, WEIGHTS, 20000,
+        ElevationType.ELEVATION_GAIN, True, TrailType.HIKING
+    )
+    assert_valid_path(manager.G, result['path'], start)
+    assert result['path'][-1] == target
+
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_street_find_shortest_path(benchmark, graph):
+    manager = graph_manager(graph, StreetGraphManager)
+    start = central_vertex(manager.G)
+    distances = manager.network_distances(start, 3000)
+    target = max(distances, key=distances.get)
+
+    result = benchmark(manager.find_shortest_path, start, target)
+    assert_valid_path(manager.G, result['path'], start)
+    assert result['path'][-1] == target
+    # Shortest by length, so it can't be longer than the trail distance found above
+    assert path_length(manager.G, result['path']) == pytest.approx(distances[target])